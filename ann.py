@@ -0,0 +1,209 @@
+import json
+import os
+
+import numpy as np
+from scipy import sparse
+
+# Bumped whenever the on-disk layout written by IVFIndex.save changes
+ANN_SNAPSHOT_VERSION = 1
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class IVFIndex:
+    """
+    An inverted file (IVF) index for approximate cosine similarity search over dense vectors.
+
+    The vectors are clustered with spherical k-means and stored grouped by cluster. A query is only compared
+    with the vectors of the `n_probe` clusters whose centroids are closest to it.
+
+    Attributes:
+        n_lists (int): Number of clusters (inverted lists). Defaults to about 4 * sqrt(number of vectors).
+        n_probe (int): Number of clusters scanned per query. Higher values trade latency for recall.
+        centroids (np.ndarray): L2-normalised cluster centroids.
+        vectors (np.ndarray): L2-normalised vectors, grouped by cluster.
+        ids (np.ndarray): Original row of every vector in `vectors`.
+        offsets (np.ndarray): Start of every cluster in `vectors`, plus the total count.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, n_iter=10, max_train_size=100_000, seed=42):
+        """
+        Initializes the IVFIndex.
+
+        Args:
+            n_lists (int): Number of clusters. Defaults to about 4 * sqrt(number of vectors).
+            n_probe (int): Number of clusters scanned per query.
+            n_iter (int): Number of k-means iterations.
+            max_train_size (int): Maximum number of vectors the centroids are trained on.
+            seed (int): Seed for centroid initialisation and training sample selection.
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.max_train_size = max_train_size
+        self.seed = seed
+
+        self.centroids = None
+        self.vectors = None
+        self.ids = None
+        self.offsets = None
+
+    def fit(self, vectors):
+        """
+        Trains the centroids and assigns every vector to its closest cluster.
+
+        Args:
+            vectors (np.ndarray): Matrix with one vector per row.
+        """
+        vectors = normalize_rows(vectors)
+        n_vectors = len(vectors)
+        n_lists = self.n_lists or int(4 * np.sqrt(n_vectors))
+        n_lists = max(1, min(n_lists, n_vectors))
+        rng = np.random.default_rng(self.seed)
+
+        train = vectors
+        if n_vectors > self.max_train_size:
+            train = vectors[rng.choice(n_vectors, self.max_train_size, replace=False)]
+
+        centroids = train[rng.choice(len(train), n_lists, replace=False)]
+        for _ in range(self.n_iter):
+            assignments = self._assign(train, centroids)
+            # Sum the vectors of every cluster with a one-hot sparse product
+            one_hot = sparse.csr_matrix(
+                (np.ones(len(train), dtype=np.float32), (assignments, np.arange(len(train)))),
+                shape=(n_lists, len(train))
+            )
+            sums = np.asarray(one_hot @ train)
+
+            # Re-seed empty clusters with random training vectors
+            empty = np.flatnonzero(np.bincount(assignments, minlength=n_lists) == 0)
+            if len(empty):
+                sums[empty] = train[rng.choice(len(train), len(empty), replace=False)]
+            centroids = normalize_rows(sums)
+
+        assignments = self._assign(vectors, centroids)
+        order = np.argsort(assignments, kind='stable')
+
+        self.n_lists = n_lists
+        self.centroids = centroids
+        self.vectors = vectors[order]
+        self.ids = order.astype(np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))]).astype(np.int64)
+
+        return self
+
+    def search(self, query_vectors, k=10, n_probe=None, mask=None):
+        """
+        Finds the approximate top `k` vectors by cosine similarity for every query vector.
+
+        Args:
+            query_vectors (np.ndarray): Matrix with one query vector per row.
+            k (int): Number of neighbours to return per query.
+            n_probe (int): Overrides the number of clusters scanned per query.
+            mask (np.ndarray): Optional boolean mask over the original rows; rows set to False are skipped. Lists
+                beyond the `n_probe` closest are scanned, closest first, until `k` rows pass the mask.
+
+        Returns:
+            list of tuple: For every query, the original rows of its neighbours and their cosine similarities,
+                best first.
+        """
+        query_vectors = normalize_rows(np.atleast_2d(query_vectors))
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+
+        centroid_scores = query_vectors @ self.centroids.T
+        if mask is None:
+            probes = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe]
+        else:
+            # every list ranked, a restrictive filter can leave fewer than k rows in the closest ones
+            probes = np.argsort(-centroid_scores, axis=1, kind='stable')
+
+        results = []
+        for query_vector, lists in zip(query_vectors, probes):
+            if mask is None:
+                positions = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists])
+            else:
+                positions = self._probe_masked(lists, mask, k, n_probe)
+
+            scores = self.vectors[positions] @ query_vector
+            top = min(k, len(scores))
+            if top == 0:
+                results.append((np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)))
+                continue
+
+            best = np.argpartition(-scores, top - 1)[:top]
+            best = best[np.argsort(-scores[best], kind='stable')]
+            results.append((self.ids[positions[best]], scores[best]))
+
+        return results
+
+    def save(self, path):
+        """
+        Writes the centroids, grouped vectors and cluster layout to a directory.
+        """
+        os.makedirs(path, exist_ok=True)
+
+        np.save(os.path.join(path, 'centroids.npy'), self.centroids)
+        np.save(os.path.join(path, 'vectors.npy'), self.vectors)
+        np.save(os.path.join(path, 'ids.npy'), self.ids)
+        np.save(os.path.join(path, 'offsets.npy'), self.offsets)
+
+        meta = {
+            'version': ANN_SNAPSHOT_VERSION,
+            'n_lists': self.n_lists,
+            'n_probe': self.n_probe,
+            'n_iter': self.n_iter,
+            'max_train_size': self.max_train_size,
+            'seed': self.seed,
+        }
+        with open(os.path.join(path, 'ivf.json'), 'w') as f:
+            json.dump(meta, f)
+
+        return path
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads an index written by `save`, memory-mapping the vectors read-only when `mmap` is set.
+        """
+        with open(os.path.join(path, 'ivf.json'), 'r') as f:
+            meta = json.load(f)
+
+        if meta.get('version') != ANN_SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported IVF snapshot version {meta.get('version')} in {path}, expected {ANN_SNAPSHOT_VERSION}.")
+
+        index = cls(
+            n_lists=meta['n_lists'],
+            n_probe=meta['n_probe'],
+            n_iter=meta['n_iter'],
+            max_train_size=meta['max_train_size'],
+            seed=meta['seed']
+        )
+        mmap_mode = 'r' if mmap else None
+        index.centroids = np.load(os.path.join(path, 'centroids.npy'))
+        index.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode=mmap_mode)
+        index.ids = np.load(os.path.join(path, 'ids.npy'), mmap_mode=mmap_mode)
+        index.offsets = np.load(os.path.join(path, 'offsets.npy'))
+
+        return index
+
+    def _probe_masked(self, lists, mask, k, n_probe):
+        found, n_found = [], 0
+        for n, i in enumerate(lists):
+            if n >= n_probe and n_found >= k:
+                break
+            positions = np.arange(self.offsets[i], self.offsets[i + 1])
+            positions = positions[mask[self.ids[positions]]]
+            found.append(positions)
+            n_found += len(positions)
+        return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+    @staticmethod
+    def _assign(vectors, centroids, chunk_size=8192):
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk_size):
+            assignments[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+        return assignments
@@ -0,0 +1,148 @@
+import collections
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+
+class ArtifactStore:
+    """
+    An on-disk store of the intermediate results of the ingestion pipeline, so a processed episode is never
+    downloaded, split or transcribed twice.
+
+    Every entry is a directory named after the hash of an episode key (its GUID or enclosure URL) plus the
+    pipeline settings the artifacts depend on. Once the entries exceed `max_bytes`, the least recently used
+    ones are deleted, except those pinned by a running job of this process (see pinning).
+
+    Attributes:
+        root (str): Directory holding the entries.
+        max_bytes (int): Maximum total size of the entries, or None for no limit.
+    """
+
+    def __init__(self, root='./artifacts', max_bytes=10 << 30):
+        """
+        Opens the store, creating its directory if it doesn't exist.
+
+        Args:
+            root (str): Directory holding the entries.
+            max_bytes (int): Maximum total size of the entries, or None for no limit.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pins = collections.Counter()
+        self._local = threading.local()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(episode_key, **config):
+        """
+        Entry key of an episode's artifacts produced with the given pipeline settings.
+        """
+        payload = json.dumps({'episode': episode_key, **config}, sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def path(self, key, name=''):
+        """
+        Path of artifact `name` of entry `key`, creating the entry directory if needed.
+        """
+        self._pin(key)
+        directory = os.path.join(self.root, key)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, name) if name else directory
+
+    def has(self, key, name):
+        return os.path.exists(os.path.join(self.root, key, name))
+
+    def get_json(self, key, name):
+        """
+        Loads a JSON artifact, or returns None if it isn't stored.
+        """
+        self._pin(key)
+        if not self.has(key, name):
+            return None
+        self._touch(key)
+        with open(os.path.join(self.root, key, name), 'r') as f:
+            return json.load(f)
+
+    def put_json(self, key, name, value):
+        self._write(key, name, lambda f: json.dump(value, f), mode='w')
+
+    def put_file(self, key, name, source):
+        """
+        Moves a file into the store and returns its new path.
+        """
+        destination = self.path(key, name)
+        shutil.move(source, destination)
+        self.evict()
+        return destination
+
+    def get_files(self, key, names):
+        """
+        Paths of the given artifacts of an entry, or None unless all of them are stored.
+        """
+        self._pin(key)
+        if not all(self.has(key, name) for name in names):
+            return None
+        self._touch(key)
+        return [os.path.join(self.root, key, name) for name in names]
+
+    @contextlib.contextmanager
+    def pinning(self):
+        """
+        Pins every entry the calling thread reads or writes until the block exits, so evictions triggered by other
+        jobs never delete the files a job is still working on.
+        """
+        self._local.keys = set()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pins -= collections.Counter(self._local.keys)
+            del self._local.keys
+
+    def evict(self):
+        """
+        Deletes the least recently used entries that aren't pinned until the store fits in `max_bytes`.
+        """
+        if self.max_bytes is None:
+            return
+
+        with self._lock:
+            entries = []
+            for key in os.listdir(self.root):
+                directory = os.path.join(self.root, key)
+                if os.path.isdir(directory):
+                    size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+                    entries.append((os.path.getmtime(directory), size, directory, key))
+
+            excess = sum(size for _, size, _, _ in entries) - self.max_bytes
+            for _, size, directory, key in sorted(entries):
+                if excess <= 0:
+                    break
+                if key in self._pins:
+                    continue
+                shutil.rmtree(directory, ignore_errors=True)
+                excess -= size
+
+    def _write(self, key, name, write, mode):
+        # Written to a temporary file first so a crash never leaves a truncated artifact behind
+        destination = self.path(key, name)
+        temporary = f"{destination}.tmp"
+        with open(temporary, mode) as f:
+            write(f)
+        os.replace(temporary, destination)
+        self._touch(key)
+        self.evict()
+
+    def _pin(self, key):
+        keys = getattr(self._local, 'keys', None)
+        if keys is not None and key not in keys:
+            with self._lock:
+                keys.add(key)
+                self._pins[key] += 1
+
+    def _touch(self, key):
+        os.utime(os.path.join(self.root, key))
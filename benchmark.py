@@ -0,0 +1,99 @@
+import json
+import time
+
+import numpy as np
+
+from ann import IVFIndex
+from minsearch import Index as minsearch
+from modified_minsearch import Index as dense_minsearch
+
+
+def load_sample_docs(n_docs):
+    """
+    Replicates the sentences of the sample episode until there are `n_docs` of them.
+
+    Every copy gets its own episode token, so the replicas don't collapse into exact duplicates.
+    """
+    with open('sample/episode_details.json', 'r') as f:
+        chunks = json.load(f)['chunks']
+
+    docs = []
+    while len(docs) < n_docs:
+        copy = len(docs) // len(chunks)
+        for chunk in chunks[:n_docs - len(docs)]:
+            docs.append({'id': f"{copy}-{chunk['id']}", 'text': f"{chunk['text']} episode{copy}"})
+
+    return docs, [chunk['text'] for chunk in chunks]
+
+
+def time_queries(search_function, queries):
+    start_time = time.time()
+    results = [search_function(query) for query in queries]
+    return (time.time() - start_time) / len(queries), results
+
+
+def benchmark_engines(n_docs=100_000, n_queries=200, num_results=5):
+    """
+    Compares fit time and per-query latency of the TF-IDF and BM25 engines of minsearch.Index.
+    """
+    docs, queries = load_sample_docs(n_docs)
+    queries = queries[:n_queries]
+    boost = {'text': 3.0}
+
+    for engine in ('tfidf', 'bm25'):
+        index = minsearch(index_name='benchmark', text_fields=['text'], keyword_fields=['id'], engine=engine)
+
+        start_time = time.time()
+        index.fit(docs)
+        fit_time = time.time() - start_time
+
+        # The first query builds the lazy structures (BM25 postings)
+        index.search(queries[0], boost_dict=boost, num_results=num_results)
+
+        latency, _ = time_queries(lambda query: index.search(query, boost_dict=boost, num_results=num_results), queries)
+
+        start_time = time.time()
+        index.search_many(queries, boost_dict=boost, num_results=num_results)
+        batched_latency = (time.time() - start_time) / len(queries)
+
+        print(f"{engine}: fit {fit_time:.2f}s, search {latency * 1000:.2f}ms/query, search_many {batched_latency * 1000:.2f}ms/query ({n_docs} docs)")
+
+
+def benchmark_ann(n_docs=20_000, n_queries=200, k=10, n_probes=(1, 4, 8, 16, 32)):
+    """
+    Measures recall@k and per-query latency of the IVF search of modified_minsearch.Index against its exact search.
+
+    Both search the same T5 embeddings of the sample episode's sentences, so the recall reflects how real transcript
+    sentences cluster. The latencies include encoding the query, which is timed on its own too.
+    """
+    docs, queries = load_sample_docs(n_docs)
+    queries = queries[:n_queries]
+    index = dense_minsearch(index_name='benchmark', text_fields=['text'], keyword_fields=['id'], tokenizer_name='t5')
+
+    start_time = time.time()
+    index.fit(docs)
+    print(f"t5: encoded {n_docs} sentences in {time.time() - start_time:.2f}s")
+
+    encoding_latency, _ = time_queries(index._huggingface_embed, queries)
+    print(f"query encoding: {encoding_latency * 1000:.2f}ms/query")
+
+    search = lambda query: [doc['id'] for doc in index.search(query, num_results=k)]
+    exact_latency, exact = time_queries(search, queries)
+    print(f"exact: {exact_latency * 1000:.2f}ms/query ({n_docs} sentences)")
+
+    start_time = time.time()
+    ivf = IVFIndex().fit(index.text_matrices['text'])
+    print(f"ivf: fit {time.time() - start_time:.2f}s, {ivf.n_lists} lists")
+
+    # the exact embeddings stay in place, so the same index answers both ways
+    index.ann_indexes = {'text': ivf}
+    for n_probe in n_probes:
+        ivf.n_probe = n_probe
+        latency, results = time_queries(search, queries)
+        recall = np.mean([len(set(ids) & set(truth)) / len(truth) for ids, truth in zip(results, exact) if truth])
+        print(f"ivf n_probe={n_probe}: recall@{k} {recall:.3f}, {latency * 1000:.2f}ms/query")
+
+
+if __name__ == "__main__":
+    benchmark_engines()
+    benchmark_ann()
@@ -0,0 +1,240 @@
+import concurrent.futures
+import hashlib
+import random
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+import openai
+
+# Per-request limits of the OpenAI embeddings endpoint
+MAX_BATCH_SIZE = 2048
+MAX_BATCH_TOKENS = 300_000
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Stays below SQLite's limit on the number of parameters of a single statement
+SQLITE_MAX_PARAMS = 500
+
+
+def estimate_tokens(text):
+    # Roughly 4 characters per token for English; 3 keeps batches safely under the limit
+    return len(text) // 3 + 1
+
+
+def make_batches(texts, max_batch_size=MAX_BATCH_SIZE, max_batch_tokens=MAX_BATCH_TOKENS):
+    """
+    Groups consecutive texts into batches that respect the per-request item and token limits.
+
+    Returns:
+        list of tuple: (start, end) offsets of every batch in `texts`.
+    """
+    batches = []
+    start, tokens = 0, 0
+    for i, text in enumerate(texts):
+        text_tokens = estimate_tokens(text)
+        if i > start and (i - start >= max_batch_size or tokens + text_tokens > max_batch_tokens):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += text_tokens
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return getattr(error, 'status_code', None) in RETRY_STATUS_CODES
+
+
+def create_embeddings(client, model, texts, max_retries=5, backoff=1.0):
+    """
+    Embeds one batch of texts, retrying with exponential backoff on rate limits, server errors and dropped connections.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            response = client.embeddings.create(model=model, input=texts)
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            time.sleep(backoff * 2 ** attempt * (1 + random.random()))
+
+
+def embed_with_openai(client, model, texts, dimensions=768, max_workers=4, max_batch_size=MAX_BATCH_SIZE, max_batch_tokens=MAX_BATCH_TOKENS, max_retries=5):
+    """
+    Embeds texts with the OpenAI embeddings API in batches, sending a bounded number of requests concurrently.
+
+    The client can point at any server that speaks the embeddings API, e.g. OpenAI(base_url="http://localhost:8000/v1").
+
+    Args:
+        client (openai.OpenAI): The embeddings client.
+        model (str): The embedding model name.
+        texts (list of str): Texts to embed.
+        dimensions (int): Number of leading dimensions kept from every embedding.
+        max_workers (int): Maximum number of requests in flight.
+        max_batch_size (int): Maximum number of texts per request.
+        max_batch_tokens (int): Maximum estimated number of tokens per request.
+        max_retries (int): Retries per request on rate limits and server errors.
+
+    Returns:
+        list of list of float: One embedding per text, in the order of `texts`.
+    """
+    texts = list(texts)
+    embeddings = [None] * len(texts)
+    batches = make_batches(texts, max_batch_size, max_batch_tokens)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(create_embeddings, client, model, texts[start:end], max_retries): (start, end) for start, end in batches
+        }
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                start, end = futures[future]
+                embeddings[start:end] = [embedding[:dimensions] for embedding in future.result()]
+        except Exception:
+            # Don't send the batches still queued once one has failed for good
+            for future in futures:
+                future.cancel()
+            raise
+
+    return embeddings
+
+
+class EmbeddingCache:
+    """
+    An on-disk cache of embeddings, shared across ingests, sentence encoders and vector databases.
+
+    Entries are keyed by the hash of (model, dimensionality, normalised text) and stored as float32 blobs in SQLite.
+    Once the stored vectors exceed `max_bytes`, the least recently used entries are evicted.
+
+    Attributes:
+        path (str): Path of the SQLite database.
+        max_bytes (int): Maximum total size of the stored vectors, or None for no limit.
+    """
+
+    def __init__(self, path='embedding_cache.db', max_bytes=1 << 30):
+        """
+        Opens the cache, creating the database if it doesn't exist.
+
+        Args:
+            path (str): Path of the SQLite database.
+            max_bytes (int): Maximum total size of the stored vectors, or None for no limit.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+
+        # Streamlit reruns the script on other threads, so share one connection behind a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)')
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model, dims, text):
+        # Unicode and whitespace variants of the same sentence share one entry
+        normalized = ' '.join(unicodedata.normalize('NFC', text).split())
+        return hashlib.sha256(f"{model}\x00{dims}\x00{normalized}".encode('utf-8')).digest()
+
+    def get_many(self, model, dims, texts):
+        """
+        Looks up the embeddings of many texts at once.
+
+        Args:
+            model (str): The embedding model name.
+            dims (int): The embedding dimensionality.
+            texts (list of str): Texts to look up.
+
+        Returns:
+            tuple: A float32 matrix with one row per text, zero for the misses, and the positions of the misses.
+        """
+        keys = [self.make_key(model, dims, text) for text in texts]
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+
+        with self._lock:
+            for start in range(0, len(unique_keys), SQLITE_MAX_PARAMS):
+                batch = unique_keys[start:start + SQLITE_MAX_PARAMS]
+                placeholders = ','.join('?' * len(batch))
+                found.update(self._conn.execute(f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders})', batch))
+            if found:
+                now = time.time()
+                self._conn.executemany('UPDATE embeddings SET last_used = ? WHERE key = ?', [(now, key) for key in found])
+                self._conn.commit()
+
+        embeddings = np.zeros((len(texts), dims), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(keys):
+            if key in found:
+                embeddings[i] = np.frombuffer(found[key], dtype=np.float32)
+            else:
+                missing.append(i)
+
+        return embeddings, missing
+
+    def put_many(self, model, dims, texts, embeddings):
+        """
+        Stores the embeddings of many texts at once, then evicts old entries if the cache is over its size limit.
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        now = time.time()
+        rows = [(self.make_key(model, dims, text), embedding.tobytes(), now) for text, embedding in zip(texts, embeddings)]
+
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)', rows)
+            self._evict()
+            self._conn.commit()
+
+    def embed(self, model, dims, texts, encode):
+        """
+        Returns the embeddings of `texts`, only sending the texts missing from the cache to `encode`.
+
+        Args:
+            model (str): The embedding model name.
+            dims (int): The embedding dimensionality.
+            texts (list of str): Texts to embed.
+            encode (callable): Maps a list of texts to a matrix with one embedding per row.
+
+        Returns:
+            np.ndarray: A float32 matrix, row i embedding texts[i].
+        """
+        texts = list(texts)
+        embeddings, missing = self.get_many(model, dims, texts)
+        if missing:
+            pending = list(dict.fromkeys(texts[i] for i in missing))
+            encoded = np.asarray(encode(pending), dtype=np.float32)
+            self.put_many(model, dims, pending, encoded)
+
+            rows = {text: row for row, text in enumerate(pending)}
+            embeddings[missing] = encoded[[rows[texts[i]] for i in missing]]
+
+        return embeddings
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM embeddings')
+            self._conn.commit()
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+
+        total = self._conn.execute('SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings').fetchone()[0]
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+
+        stale = []
+        for key, size in self._conn.execute('SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used'):
+            if excess <= 0:
+                break
+            stale.append((key,))
+            excess -= size
+        self._conn.executemany('DELETE FROM embeddings WHERE key = ?', stale)
@@ -1,17 +1,102 @@
-from minsearch import Index as minsearch
+import contextlib
+import fcntl
+import hashlib
+import os
+import time
+from email.utils import parsedate_to_datetime
+import numpy as np
+import torch
+from elasticsearch.helpers import parallel_bulk
+from minsearch import Index as minsearch, HybridIndex
 from utils import get_episode_title, get_podcast_details, get_feed_details, search_for_episode, fetch_latest_episode, download_all
 import json
-from transcribe import transcribe_with_replicate, transcribe_with_whistler
+from transcribe import transcribe_with_replicate, transcribe_with_whistler, iter_transcribe_with_replicate, iter_transcribe_with_whistler, merge_outputs, stitch_chunks, REPLICATE_MAX_CONCURRENCY
+from embeddings import embed_with_openai
+
+# Fields every sentence carries so one library index can hold many episodes
+LIBRARY_FIELDS = ['podcast_id', 'episode_guid', 'publish_date']
+# where every sentence starts and ends in the episode, in seconds
+TIME_FIELDS = ['start', 'end']
+
+def get_episode_key(episode_details):
+    # episodes from feeds without GUIDs are told apart by their audio URL
+    return episode_details.get('guid') or episode_details.get('audio_urls') or episode_details.get('title', '')
+
+def get_episode_metadata(episode_details):
+    """
+    Library fields of an episode: the show's iTunes id, the episode's feed GUID and its publish date as a YYYYMMDD integer.
+    """
+    try:
+        publish_date = int(parsedate_to_datetime(episode_details['published_date']).strftime('%Y%m%d'))
+    except (KeyError, TypeError, ValueError):
+        publish_date = 0
+
+    return {
+        'podcast_id': str(episode_details.get('podcast_id', '')),
+        'episode_guid': get_episode_key(episode_details),
+        'publish_date': publish_date
+    }
+
+def get_library_path(**kwargs):
+    # the hybrid library holds embeddings too, so it is kept apart from the Minsearch one
+    suffix = '-hybrid' if kwargs.get('vector_db') == "4. Hybrid" else ''
+    return os.path.join(kwargs.get('library_path', './library'), kwargs['index_name'] + suffix)
+
+@contextlib.contextmanager
+def library_lock(library_path):
+    """
+    Holds an exclusive lock on the library for reading or rewriting its snapshot.
+
+    Sessions, jobs and app processes all save into the same library, so its loads and saves are serialized through
+    a lock file next to it.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(library_path)), exist_ok=True)
+    with open(f"{library_path}.lock", 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def load_library(library_path, index_class=minsearch):
+    """
+    Loads the library written by earlier ingests as an `index_class` (minsearch.Index or HybridIndex), or returns None
+    if there is none yet. Call under library_lock.
+    """
+    if os.path.exists(os.path.join(library_path, 'meta.json')):
+        return index_class.load(library_path, mmap=False)
+    return None
+
+def create_minsearch_index(index_name, library_path=None):
+    # reopen the library written by earlier ingests
+    if library_path is not None:
+        with library_lock(library_path):
+            library = load_library(library_path)
+        if library is not None:
+            return library
 
-def create_minsearch_index(index_name):
     return minsearch(
         index_name = index_name,
         text_fields = ['text'],
-        keyword_fields = ['id']
+        keyword_fields = ['id'] + LIBRARY_FIELDS + TIME_FIELDS
+    )
+
+def create_hybrid_index(index_name, library_path=None):
+    # reopen the library written by earlier ingests, as for Minsearch
+    if library_path is not None:
+        with library_lock(library_path):
+            library = load_library(library_path, HybridIndex)
+        if library is not None:
+            return library
+
+    return HybridIndex(
+        index_name = index_name,
+        text_fields = ['text'],
+        keyword_fields = ['id'] + LIBRARY_FIELDS + TIME_FIELDS
     )
 
-def create_es_index(client, index_name):
-    # Create mapping
+def create_es_index(client, index_name, dims=768, quantize=False, hnsw_m=16, hnsw_ef_construction=100, reset=False):
+    # Create mapping, with the vectors in an HNSW graph so knn queries don't scan every document
     index_settings = {
         "settings": {
             "number_of_shards": 1,
@@ -20,24 +105,79 @@ def create_es_index(client, index_name):
         "mappings": {
             "properties": {
                 "id": {"type": "keyword", "store": True},
+                "podcast_id": {"type": "keyword"},
+                "episode_guid": {"type": "keyword"},
+                "publish_date": {"type": "integer"},
+                "start": {"type": "float"},
+                "end": {"type": "float"},
                 "text": {"type": "text"},
-                "text_vector": {"type": "dense_vector", "dims": 768},
+                "text_vector": {
+                    "type": "dense_vector",
+                    "dims": dims,
+                    "index": True,
+                    "similarity": "cosine",
+                    "index_options": {
+                        # int8 quantization keeps a quarter of the vector memory for a small loss in recall
+                        "type": "int8_hnsw" if quantize else "hnsw",
+                        "m": hnsw_m,
+                        "ef_construction": hnsw_ef_construction
+                    }
+                },
             }
         }
     }
 
-    client.indices.delete(index=index_name, ignore_unavailable=True)
-    client.indices.create(index=index_name, body=index_settings)
+    # The library index is kept across ingests, unless a reset is asked for
+    if reset:
+        client.indices.delete(index=index_name, ignore_unavailable=True)
+    if not client.indices.exists(index=index_name):
+        client.indices.create(index=index_name, body=index_settings)
+    else:
+        migrate_es_index(client, index_name, index_settings)
     
     return client.indices.get_alias(index=index_name)
 
-def create_chroma_index(client, index_name):
+def es_mapping_matches(current, expected):
+    if current.get('type') != expected['type']:
+        return False
+    if expected['type'] == 'dense_vector':
+        # vectors that aren't indexed can't be searched with knn
+        return current.get('dims') == expected['dims'] and current.get('index', True) is not False
+    return True
+
+def migrate_es_index(client, index_name, index_settings):
+    """
+    Brings a library index created by an earlier version up to the current mapping.
+
+    Missing fields, e.g. the library fields, are added in place. A field of another type, e.g. episode_guid mapped
+    as text or vectors not indexed for knn, can't be changed in place, so the documents are reindexed into a new
+    index which then takes over the old name as an alias.
+    """
+    properties = index_settings['mappings']['properties']
+    # `index_name` may already be an alias of a migrated index
+    (concrete_name, mapping), = client.indices.get_mapping(index=index_name).items()
+    current = mapping['mappings'].get('properties', {})
+
+    if all(es_mapping_matches(current[field], spec) for field, spec in properties.items() if field in current):
+        missing = {field: spec for field, spec in properties.items() if field not in current}
+        if missing:
+            client.indices.put_mapping(index=concrete_name, properties=missing)
+        return
+
+    new_name = f"{index_name}-{int(time.time())}"
+    print(f"Migrating index {concrete_name} to the current mapping as {new_name}.")
+    client.indices.create(index=new_name, body=index_settings)
+    client.reindex(source={'index': concrete_name}, dest={'index': new_name}, wait_for_completion=True, refresh=True)
+    client.indices.delete(index=concrete_name)
+    client.indices.put_alias(index=new_name, name=index_name)
+
+def create_chroma_index(client, index_name, reset=False):
     existing_collections = client.list_collections()
 
-    # Check if the collection exists
+    # The collection is kept across runs so sentences already embedded are reused, unless a reset is asked for
     if index_name in [collection.name for collection in existing_collections]:
-        # Delete the collection if it exists
-        client.delete_collection(index_name)
+        if reset:
+            client.delete_collection(index_name)
     else:
         print(f"Index {index_name} does not exist in the current collection.")
 
@@ -53,11 +193,37 @@ def create_index(**kwargs):
     vector_db = kwargs['vector_db']
 
     if vector_db == "1. Minsearch":
-        return create_minsearch_index(index_name=kwargs['index_name'])
+        return create_minsearch_index(index_name=kwargs['index_name'], library_path=get_library_path(**kwargs))
     elif vector_db == "2. Elasticsearch":
-        return create_es_index(client=kwargs['vector_db_client'], index_name=kwargs['index_name'])
+        return create_es_index(
+            client=kwargs['vector_db_client'],
+            index_name=kwargs['index_name'],
+            quantize=kwargs.get('es_quantize', False),
+            reset=kwargs.get('es_reset', False)
+            )
     elif vector_db == "3. ChromaDB":
-        return create_chroma_index(client=kwargs['vector_db_client'], index_name=kwargs['index_name'])
+        return create_chroma_index(client=kwargs['vector_db_client'], index_name=kwargs['index_name'], reset=kwargs.get('chroma_reset', False))
+    elif vector_db == "4. Hybrid":
+        return create_hybrid_index(index_name=kwargs['index_name'], library_path=get_library_path(**kwargs))
+
+def download_episode_audio(episode_details, podcast_name, artifact_store=None):
+    """
+    Downloads the audio of the episode, or reuses the copy kept in the artifact store.
+    """
+    if artifact_store is not None:
+        key = artifact_store.key(get_episode_key(episode_details))
+        filenames = artifact_store.get_files(key, ['episode.mp3'])
+        if filenames is not None:
+            return filenames
+
+    filenames = download_all(episode_details, podcast_name)
+    if None in filenames:
+        raise RuntimeError(f"Failed to download {episode_details['audio_urls']}")
+
+    if artifact_store is not None:
+        filenames = [artifact_store.put_file(key, 'episode.mp3', filename) for filename in filenames]
+
+    return filenames
 
 def download_episode_from_url(url, sentence_encoder, **kwargs):
     try:
@@ -83,8 +249,9 @@ def download_episode_from_url(url, sentence_encoder, **kwargs):
 
         if episode_details['cos_sim'] < 0.95:
             raise Exception
+        episode_details['podcast_id'] = podcast_details['collectionId']
         episode_details['filenames'] = []
-        episode_details['filenames'] += download_all(episode_details['audio_urls'], podcast_details['collectionName'])
+        episode_details['filenames'] += download_episode_audio(episode_details, podcast_details['collectionName'], kwargs.get('artifact_store'))
         episode_details['status'] = 'Success'
         episode_details['status_message'] = f"Podcast {podcast_details['collectionName']} downloaded successfully."
     except Exception:
@@ -95,12 +262,13 @@ def download_episode_from_url(url, sentence_encoder, **kwargs):
 
     return episode_details
 
-def download_episode_from_name(id, name):
+def download_episode_from_name(id, name, artifact_store=None):
     try:
         podcast_details = get_podcast_details(id)
         episode_details = fetch_latest_episode(podcast_details['feedUrl'])
+        episode_details['podcast_id'] = id
         episode_details['filenames'] = []
-        episode_details['filenames'] += download_all(episode_details['audio_urls'], name)
+        episode_details['filenames'] += download_episode_audio(episode_details, name, artifact_store)
         episode_details['status'] = 'Success'
         episode_details['status_message'] = f"Podcast {podcast_details['collectionName']} - {name} downloaded successfully."
         return episode_details
@@ -122,12 +290,17 @@ def download_podcast(**kwargs):
             kwargs['sentence_encoder'],
             encoder=kwargs['encoder'] if 'encoder' in kwargs.keys() else None,
             embedding_client=kwargs['embedding_client'] if 'embedding_client' in kwargs.keys() else None,
-            embedding_model=kwargs['embedding_model'] if 'embedding_model' in kwargs.keys() else None
+            embedding_model=kwargs['embedding_model'] if 'embedding_model' in kwargs.keys() else None,
+            artifact_store=kwargs.get('artifact_store')
             )
     elif option == "3. Provide a name of a podcast to explore its most recent episode":
         found_podcasts = kwargs['found_podcasts']
         selected_index = kwargs['selected_index']
-        episode_details = download_episode_from_name(found_podcasts[selected_index]['collectionId'], found_podcasts[selected_index]['collectionName'])
+        episode_details = download_episode_from_name(
+            found_podcasts[selected_index]['collectionId'],
+            found_podcasts[selected_index]['collectionName'],
+            artifact_store=kwargs.get('artifact_store')
+            )
     return episode_details
 
 def transcribe_podcast(**kwargs):
@@ -139,84 +312,400 @@ def transcribe_podcast(**kwargs):
     else:
         transcription_method = kwargs['transcription_method']
         if transcription_method == "1. Replicate":
-            chunks, text = transcribe_with_replicate(kwargs['transcription_client'], episode_details['filenames'], n_splits=2)
+            chunks, text = transcribe_with_replicate(
+                kwargs['transcription_client'],
+                episode_details['filenames'],
+                max_concurrency=kwargs.get('transcription_concurrency', REPLICATE_MAX_CONCURRENCY)
+            )
         elif transcription_method == "2. Local transcription":
-            chunks, text = transcribe_with_whistler(episode_details['filenames'], n_splits=2) # 4 splits took 800 seconds / try it in streamlit
+            chunks, text = transcribe_with_whistler(episode_details['filenames'])
     
     return {'chunks': chunks, 'text': text}
 
-def create_oa_embedding(client, model, chunks):
-    documents = []
-
-    for sentence in chunks:
-        temp_dict = {
-            'id': sentence['id'],
-            'text': sentence['text'],
-            'text_vector': client.embeddings.create(model=model, input=sentence['text']).data[0].embedding[:768] # openai embeddings 3 provides flexibility when cutting embedding size 
-        }
-        documents.append(temp_dict)
-
-    return documents
-
-def create_t5_embedding(encoder, chunks):
-    documents = []
+def iter_transcribe_podcast(**kwargs):
+    """
+    Yields (i, n_parts, output) for every transcribed part of the episode, in order, as soon as it is ready.
+    """
+    podcast_option = kwargs['episode_option']
+    episode_details = kwargs['episode_details']
 
-    for sentence in chunks:
-        temp_dict = {
-            'id': sentence['id'],
-            'text': sentence['text'],
-            'text_vector': encoder.encode(sentence["text"]).tolist()
-        }
-        documents.append(temp_dict)
-    
-    return documents
+    if podcast_option == "1. Try a sample":
+        yield 0, 1, {'chunks': episode_details['chunks'], 'text': episode_details['text']}
+        return
+
+    transcription_method = kwargs['transcription_method']
+
+    # a transcript made earlier with the same settings is reused whole
+    artifact_store = kwargs.get('artifact_store')
+    if artifact_store is not None:
+        key = artifact_store.key(get_episode_key(episode_details), transcription_method=transcription_method, splitting='silence', timestamps=True)
+        transcript = artifact_store.get_json(key, 'transcript.json')
+        if transcript is not None:
+            yield 0, 1, transcript
+            return
+
+    if transcription_method == "1. Replicate":
+        parts = iter_transcribe_with_replicate(
+            kwargs['transcription_client'],
+            episode_details['filenames'],
+            max_concurrency=kwargs.get('transcription_concurrency', REPLICATE_MAX_CONCURRENCY)
+        )
+    elif transcription_method == "2. Local transcription":
+        # the CPU threads given to the transcription are split between the model's two workers
+        threads = kwargs.get('transcription_threads')
+        parts = iter_transcribe_with_whistler(episode_details['filenames'], cpu_threads=max(1, threads // 2) if threads else None, num_workers=2)
+
+    outputs = []
+    for i, n_parts, output in parts:
+        outputs.append(output)
+        yield i, n_parts, output
+
+    if artifact_store is not None:
+        chunks, text = merge_outputs(outputs)
+        artifact_store.put_json(key, 'transcript.json', {'chunks': chunks, 'text': text})
+
+def stream_podcast(**kwargs):
+    """
+    Transcribes, encodes and indexes the episode part by part, so the first parts are searchable
+    while the later ones are still being transcribed.
+
+    The chunks and text of `episode_details` grow as parts come in. Indexing is done under `index_lock`,
+    if given, so searches running on other threads never see a half-updated index. State changes and progress
+    are passed to `report`, if given, e.g. the report method of a jobs.Job. Every indexed part is passed to
+    `record_part`, if given, as its number, the number of chunks it replaced at the end of the parts before it
+    (`drop`) and its own `chunks`, e.g. to the add_part method of a jobs.Job.
+
+    Yields:
+        dict: Progress after every indexed part: the part number, the number of parts, the number of chunks so far
+            and how many of them the vector database rejected.
+    """
+    episode_details = kwargs['episode_details']
+    index_lock = kwargs.get('index_lock') or contextlib.nullcontext()
+    report = kwargs.get('report') or (lambda state=None, **progress: None)
+    record_part = kwargs.get('record_part') or (lambda part, **output: None)
+    chunks, n_failed = [], 0
+
+    report('transcribing')
+    for i, n_parts, output in iter_transcribe_podcast(**kwargs):
+        report('indexing')
+        # the start of every part overlaps the end of the one before, already indexed
+        drop, part_chunks = stitch_chunks(chunks, output['chunks'])
+        # the last sentences of the part before were cut off, this part has them whole and takes over their ids
+        dropped, chunks = chunks[len(chunks) - drop:], chunks[:len(chunks) - drop]
+        for j, chunk in enumerate(part_chunks):
+            chunk['id'] = str(len(chunks) + j + 1)
+        chunks = chunks + part_chunks
+        text = " ".join(chunk['text'].strip() for chunk in chunks)
+        episode_details.update({'chunks': chunks, 'text': text})
+
+        part_details = {**episode_details, 'chunks': part_chunks}
+        if kwargs['vector_db'] != "1. Minsearch":
+            part_details.update(encode_podcast(**{**kwargs, 'episode_details': part_details}))
+
+        with index_lock:
+            if dropped:
+                remove_chunks(**{**kwargs, 'episode_details': {**episode_details, 'chunks': dropped}})
+            failed = index_podcast(**{**kwargs, 'episode_details': part_details}, replace_episode=i == 0, save_library=i == n_parts - 1)
+        n_failed += len(failed)
+        # recorded before the progress that announces it
+        record_part(i, drop=drop, chunks=part_chunks)
+
+        progress = {'part': i + 1, 'n_parts': n_parts, 'n_chunks': len(chunks), 'n_failed': n_failed}
+        report('transcribing' if i < n_parts - 1 else None, **progress)
+        yield progress
+
+def ingest_podcast(job, **kwargs):
+    """
+    Job function downloading, transcribing, encoding and indexing an episode, to be submitted to a jobs.JobQueue.
+
+    The episode details, without the transcript, are recorded as the job output as soon as the download is done, and
+    the chunks of every indexed part are recorded as a part of the job, see merge_parts. Transcription and encoding use the job's share of the CPU cores unless the thread counts are given, and the
+    artifacts the job uses are pinned in the artifact store until it is done.
+    """
+    kwargs = {'transcription_threads': job.num_threads, 'encoding_threads': job.num_threads, **kwargs}
+    artifact_store = kwargs.get('artifact_store')
+
+    with artifact_store.pinning() if artifact_store is not None else contextlib.nullcontext():
+        job.report('downloading')
+        episode_details = download_podcast(**kwargs)
+        if episode_details['status'] != 'Success':
+            raise RuntimeError(episode_details['status_message'])
+        job.set_output(episode_details={key: value for key, value in episode_details.items() if key not in ('chunks', 'text')})
+
+        for _ in stream_podcast(**{**kwargs, 'episode_details': episode_details}, report=job.report, record_part=job.add_part):
+            pass
+
+def merge_parts(episode_details, parts):
+    """
+    Returns `episode_details` with the chunks and text of the parts recorded by stream_podcast added to its own.
+    """
+    chunks = episode_details.get('chunks', [])
+    for part in parts:
+        chunks = chunks[:len(chunks) - part['drop']] + part['chunks']
+    text = " ".join(chunk['text'].strip() for chunk in chunks)
+    return {**episode_details, 'chunks': chunks, 'text': text}
+
+def get_chunk_times(chunk):
+    # Replicate leaves the end of the last sentence open
+    start, end = chunk.get('timestamp') or (None, None)
+    return {'start': start, 'end': end if end is not None else start}
+
+def create_documents(chunks, metadata={}):
+    return [{'id': sentence['id'], 'text': sentence['text'], **get_chunk_times(sentence), **metadata} for sentence in chunks]
+
+def create_oa_embedding(client, model, texts, dimensions=768):
+    # openai embeddings 3 provides flexibility when cutting embedding size
+    text_vectors = embed_with_openai(client, model, texts, dimensions=dimensions)
+
+    return np.asarray(text_vectors, dtype=np.float32)
+
+def create_t5_embedding(encoder, texts, batch_size=64, num_threads=None):
+    """
+    Encodes all texts in batches into one float32 matrix, row i embedding texts[i].
+    """
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    embeddings = encoder.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
 
 def encode_podcast(**kwargs):
     episode_details = kwargs['episode_details']
     sentence_encoder = kwargs['sentence_encoder']
+    texts = [sentence['text'] for sentence in episode_details['chunks']]
 
     if sentence_encoder == "1. T5":
-        documents = create_t5_embedding(kwargs['encoder'], episode_details['chunks'])
+        encoder = kwargs['encoder']
+        model, dims = kwargs.get('encoder_name', 'sentence-t5-base'), encoder.get_sentence_embedding_dimension()
+        encode = lambda texts: create_t5_embedding(
+            encoder,
+            texts,
+            batch_size=kwargs.get('encoding_batch_size', 64),
+            num_threads=kwargs.get('encoding_threads')
+            )
     elif sentence_encoder == "2. OpenAI":
-        documents = create_oa_embedding(kwargs['embedding_client'], kwargs['embedding_model'], episode_details['chunks'])
-
-    return {'documents': documents}
+        model, dims = kwargs['embedding_model'], 768
+        encode = lambda texts: create_oa_embedding(kwargs['embedding_client'], model, texts, dimensions=dims)
 
-def populate_minsearch_index(docs, index):
-    documents = [{'id': str(doc['id']), 'text': doc['text']} for doc in docs]
-    index.fit(documents)
-
-def populate_es_index(documents, index_name, client):
-    # add documents 
-    for doc in documents:
-        try:
-            client.index(index=index_name, body=doc)
-        except Exception as e:
-            print(e)
+    # only the sentences missing from the cache are sent to the encoder
+    embedding_cache = kwargs.get('embedding_cache')
+    if embedding_cache is not None:
+        embeddings = embedding_cache.embed(model, dims, texts, encode)
+    else:
+        embeddings = encode(texts)
+
+    documents = create_documents(episode_details['chunks'], get_episode_metadata(episode_details))
+
+    return {'documents': documents, 'embeddings': embeddings}
+
+def populate_minsearch_index(docs, index, metadata, library_path=None, replace_episode=True):
+    documents = [{**doc, 'id': str(doc['id'])} for doc in create_documents(docs, metadata)]
+
+    # re-ingesting an episode replaces its sentences, the other episodes are left as they are
+    if index.docs and replace_episode:
+        index.remove([metadata['episode_guid']], id_field='episode_guid')
+    index.add(documents)
+
+    if library_path is not None:
+        save_library(index, library_path, metadata['episode_guid'])
+
+def save_library(index, library_path, episode_guid):
+    """
+    Writes the episode's sentences from `index` into the library on disk, then brings `index` up to date with it.
+
+    Other sessions and jobs save their own episodes into the same library meanwhile, so saving `index` as it is
+    would drop theirs. Instead the library is reloaded under the lock and only this episode is replaced in it.
+    `index` is a minsearch.Index or a HybridIndex, whose episode embeddings are saved with its sentences.
+    """
+    hybrid = isinstance(index, HybridIndex)
+    lexical = index.lexical if hybrid else index
+    rows = [row for row, (doc, deleted) in enumerate(zip(lexical.docs, lexical.deleted)) if not deleted and doc.get('episode_guid') == episode_guid]
+    documents = [lexical.docs[row] for row in rows]
+
+    with library_lock(library_path):
+        if hybrid:
+            library = load_library(library_path, HybridIndex) or create_hybrid_index(index.index_name)
+        else:
+            library = load_library(library_path) or create_minsearch_index(index.index_name)
+        if library.docs:
+            library.remove([episode_guid], id_field='episode_guid')
+        if hybrid:
+            library.add(documents, index.embeddings[rows])
+        else:
+            library.add(documents)
+        library.save(library_path)
+
+    # the session keeps its index object, which now holds the other sessions' episodes too
+    index.__dict__.update(library.__dict__)
+
+def populate_hybrid_index(documents, embeddings, index, library_path=None, replace_episode=True):
+    documents = [{**doc, 'id': str(doc['id'])} for doc in documents]
+    if not documents:
+        return
+
+    # re-ingesting an episode replaces its sentences, the other episodes are left as they are
+    if index.docs and replace_episode:
+        index.remove([documents[0]['episode_guid']], id_field='episode_guid')
+    index.add(documents, embeddings)
+
+    if library_path is not None:
+        save_library(index, library_path, documents[0]['episode_guid'])
+
+def generate_es_actions(documents, embeddings, index_name):
+    # created only if missing, a sentence already indexed under its id is left as it is
+    for doc, text_vector in zip(documents, embeddings):
+        yield {'_op_type': 'create', '_index': index_name, '_id': make_chunk_id(doc.get('episode_guid', ''), doc), '_source': {**doc, 'text_vector': text_vector.tolist()}}
+
+def populate_es_index(documents, embeddings, index_name, client, chunk_size=500, thread_count=4, replace_episode=True):
+    """
+    Loads the documents missing from the index with parallel _bulk requests, with refreshes disabled until the
+    load is done. Documents already indexed under their id, which hashes their text, are skipped.
+
+    With `replace_episode`, the sentences an earlier ingest of the episode indexed that aren't among `documents`
+    any more are deleted first, e.g. those of an edited transcript.
+
+    Returns:
+        dict: The index name, the number of indexed and skipped documents and one record per failed document.
+    """
+    indexed, skipped, failed = 0, 0, []
+
+    if replace_episode and documents:
+        client.delete_by_query(
+            index=index_name,
+            query={
+                "bool": {
+                    "filter": [{"term": {"episode_guid": documents[0]['episode_guid']}}],
+                    "must_not": [{"ids": {"values": [make_chunk_id(doc['episode_guid'], doc) for doc in documents]}}]
+                }
+            },
+            conflicts='proceed',
+            refresh=True
+        )
+
+    client.indices.put_settings(index=index_name, settings={'index': {'refresh_interval': '-1'}})
+    try:
+        for ok, item in parallel_bulk(
+            client,
+            generate_es_actions(documents, embeddings, index_name),
+            thread_count=thread_count,
+            chunk_size=chunk_size,
+            raise_on_error=False,
+            raise_on_exception=False
+            ):
+            if ok:
+                indexed += 1
+                continue
+            _, result = item.popitem()
+            if result.get('status') == 409:
+                # already indexed
+                skipped += 1
+            else:
+                failed.append({'id': result.get('_id'), 'status': result.get('status'), 'error': result.get('error')})
+    finally:
+        # back to the default refresh interval, then make everything searchable at once
+        client.indices.put_settings(index=index_name, settings={'index': {'refresh_interval': None}})
+        client.indices.refresh(index=index_name)
+
+    return {'index_name': index_name, 'indexed': indexed, 'skipped': skipped, 'failed': failed}
+
+def make_chunk_id(episode_key, doc):
+    # Stable across runs, so re-ingesting an episode maps every sentence onto its existing entry
+    return hashlib.sha1(f"{episode_key}\x00{doc['id']}\x00{doc['text']}".encode('utf-8')).hexdigest()
+
+def populate_chroma_collection(documents, embeddings, collection, batch_size=5000, replace_episode=True):
+    """
+    Upserts the documents missing from the collection, in batches below Chroma's maximum batch size.
+
+    With `replace_episode`, the sentences an earlier ingest of the episode stored that aren't among `documents`
+    any more are deleted, as in populate_es_index.
+
+    Returns:
+        int: The number of documents written.
+    """
+    ids = [make_chunk_id(doc.get('episode_guid', ''), doc) for doc in documents]
+
+    if replace_episode and documents:
+        stored = set(collection.get(where={'episode_guid': documents[0]['episode_guid']}, include=[])['ids'])
+        stale = sorted(stored - set(ids))
+        for start in range(0, len(stale), batch_size):
+            collection.delete(ids=stale[start:start + batch_size])
+        existing = stored & set(ids)
+    else:
+        existing = set()
+        for start in range(0, len(ids), batch_size):
+            existing.update(collection.get(ids=ids[start:start + batch_size], include=[])['ids'])
+    new_rows = [i for i, id in enumerate(ids) if id not in existing]
+
+    for start in range(0, len(new_rows), batch_size):
+        rows = new_rows[start:start + batch_size]
+        collection.upsert(
+            ids=[ids[i] for i in rows],
+            embeddings=embeddings[rows],
+            # Chroma metadata can't hold None, e.g. the times of an untimed transcript
+            metadatas=[{field: documents[i][field] for field in ['text'] + LIBRARY_FIELDS + TIME_FIELDS if documents[i].get(field) is not None} for i in rows]
+        )
+
+    return len(new_rows)
 
-    return index_name
+def index_podcast(**kwargs):
+    """
+    Indexes the sentences of `episode_details` into the chosen vector database.
 
-def populate_chroma_collection(documents, collection):
-    ids = [str(i+1) for i in range(len(documents))]
-    embeddings = [doc['text_vector'] for doc in documents]
-    texts = [doc['text'] for doc in documents]
+    Returns:
+        list of dict: The sentences the vector database rejected, as reported by populate_es_index. Empty for the
+            other databases, which fail as a whole.
+    """
+    episode_details = kwargs['episode_details']
+    vector_db = kwargs['vector_db']
 
-    # print(ids[:4])
-    # print('string')
-    
-    collection.add(
-        ids=ids,
-        embeddings=embeddings,
-        metadatas=[{"text": text} for text in texts]
-    )
+    if vector_db=="1. Minsearch":
+        populate_minsearch_index(
+            episode_details['chunks'],
+            kwargs['index'],
+            get_episode_metadata(episode_details),
+            library_path=get_library_path(**kwargs) if kwargs.get('save_library', True) else None,
+            replace_episode=kwargs.get('replace_episode', True)
+            )
+    elif vector_db=="2. Elasticsearch":
+        return populate_es_index(
+            episode_details['documents'],
+            episode_details['embeddings'],
+            kwargs['index_name'],
+            kwargs['vector_db_client'],
+            replace_episode=kwargs.get('replace_episode', True)
+            )['failed']
+    elif vector_db=="3. ChromaDB":
+        populate_chroma_collection(episode_details['documents'], episode_details['embeddings'], kwargs['index'], replace_episode=kwargs.get('replace_episode', True))
+    elif vector_db=="4. Hybrid":
+        populate_hybrid_index(
+            episode_details['documents'],
+            episode_details['embeddings'],
+            kwargs['index'],
+            library_path=get_library_path(**kwargs) if kwargs.get('save_library', True) else None,
+            replace_episode=kwargs.get('replace_episode', True)
+            )
+    return []
 
-def index_podcast(**kwargs):
+def remove_chunks(**kwargs):
+    """
+    Removes the chunks of `episode_details` from the index, e.g. a sentence cut off at the end of a part and
+    transcribed whole again with the next one.
+    """
     episode_details = kwargs['episode_details']
     vector_db = kwargs['vector_db']
+    guid = get_episode_metadata(episode_details)['episode_guid']
+    # chunk ids are only unique within an episode
+    ids = [str(chunk['id']) for chunk in episode_details['chunks']]
 
-    if vector_db=="1. Minsearch":
-        populate_minsearch_index(episode_details['chunks'], kwargs['index'])
+    if vector_db in ("1. Minsearch", "4. Hybrid"):
+        kwargs['index'].remove(ids, filter_dict={'episode_guid': guid})
     elif vector_db=="2. Elasticsearch":
-        populate_es_index(episode_details['documents'], kwargs['index_name'], kwargs['vector_db_client'])
+        kwargs['vector_db_client'].delete_by_query(
+            index=kwargs['index_name'],
+            query={"bool": {"filter": [{"term": {"episode_guid": guid}}, {"terms": {"id": ids}}]}},
+            conflicts='proceed',
+            refresh=True
+        )
     elif vector_db=="3. ChromaDB":
-        populate_chroma_collection(episode_details['documents'], kwargs['index'])        
+        kwargs['index'].delete(ids=[make_chunk_id(guid, chunk) for chunk in episode_details['chunks']])
@@ -2,8 +2,10 @@ import pysqlite3
 import sys
 sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
 import streamlit as st
+import threading
 from streamlit_functions import *
-from ingest import download_podcast, transcribe_podcast, encode_podcast, index_podcast
+from ingest import ingest_podcast
+from jobs import FINISHED_STATES
 from rag import rag
 from bs4 import BeautifulSoup
 import pandas as pd
@@ -51,40 +53,28 @@ if __name__ == "__main__":
     st.title("Podcast Search and Download Tool")
 
     if st.session_state.get('settings_applied', False):
-        # download
+        # download, transcribe, encode and index on the background workers, the chat opens once the first part is indexed
         if not st.session_state.get('interaction_started', False):
-            with st.spinner('Downloading...'):
-                episode_details = download_podcast(**st.session_state)
-                if episode_details['status'] == 'Success':
-                    st.success(episode_details['status_message'])
-                    update_session(episode_details=episode_details, podcast_downloaded=True)
-                else:
-                    st.warning(episode_details['status_message'])
-                    update_session(podcast_downloaded=False)
-
-        # transcribe
-        if st.session_state['podcast_downloaded'] and not st.session_state.get('interaction_started', False):
-            with st.spinner('Transcribing...'):
-                st.session_state['episode_details'].update(transcribe_podcast(**st.session_state))
-                update_session(podcast_transcribed=True)
-
-        # encode
-        if st.session_state['podcast_transcribed'] and not st.session_state.get('interaction_started', False):
-            with st.spinner('Encoding...'):
-                if st.session_state['vector_db'] != "1. Minsearch":
-                    try:
-                        st.session_state['episode_details'].update(encode_podcast(**st.session_state))
-                        update_session(podcast_embedded=True)
-                    except:
-                        st.warning("Encoding failed.")          
-                        update_session(podcast_embedded=False)
-                else:
-                    update_session(podcast_embedded=True)
-
-        # populate index
-        if st.session_state['podcast_embedded'] and not st.session_state.get('interaction_started', False):
-            with st.spinner('Indexing...'):
-                index_podcast(**st.session_state)
+            job_queue = get_job_queue()
+            if 'job_id' not in st.session_state:
+                update_session(index_lock=threading.Lock())
+                update_session(job_id=job_queue.submit(
+                    ingest_podcast,
+                    description=st.session_state.get('episode_url') or st.session_state['episode_option'],
+                    artifact_store=get_artifact_store(),
+                    **st.session_state.to_dict()
+                    ))
+
+            job = job_queue.get(st.session_state['job_id'])
+            if job['state'] == 'failed':
+                st.warning(f"Ingestion failed: {job['error']}")
+                update_session(podcast_indexed=False)
+            elif 'part' not in job['progress']:
+                show_job_state(st.session_state['job_id'])
+                update_session(podcast_indexed=False)
+            else:
+                refresh_episode_details(st.session_state['job_id'])
+                st.success(st.session_state['episode_details']['status_message'])
                 update_session(podcast_indexed=True)
 
         # interact
@@ -124,6 +114,17 @@ if __name__ == "__main__":
             chatbox_container = st.container()
             with chatbox_container:
                 st.subheader("Chat with your podcast")
+                job_queue = get_job_queue()
+                job = job_queue.get(st.session_state['job_id'])
+                # the transcript grows as the rest of the episode is indexed
+                refresh_episode_details(job['id'])
+                if job['state'] not in FINISHED_STATES:
+                    st.info(f"Indexed part {job['progress']['part']} of {job['progress']['n_parts']}, the rest of the episode is still being processed.")
+                elif job['state'] == 'failed':
+                    st.warning(f"Only {job['progress']['part']} of {job['progress']['n_parts']} parts were indexed: {job['error']}")
+                if job['progress'].get('n_failed'):
+                    st.warning(f"{job['progress']['n_failed']} of {job['progress']['n_chunks']} sentences could not be indexed and won't show up in searches.")
+                choose_search_scope()
                 episode_details = st.session_state['episode_details']
                 index_name = st.session_state['index_name']
 
@@ -0,0 +1,260 @@
+import concurrent.futures
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+JOB_STATES = ('queued', 'downloading', 'transcribing', 'indexing', 'done', 'failed')
+FINISHED_STATES = ('done', 'failed')
+
+
+class Job:
+    """
+    Handle passed to a running job function.
+
+    Attributes:
+        id (str): The job id.
+        output (dict): Results recorded with set_output, e.g. the episode details.
+        num_threads (int): The job's share of the CPU cores, to size the thread pools of its CPU-bound stages.
+    """
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.id = job_id
+        self.output = {}
+        self.num_threads = queue.threads_per_job
+
+    def report(self, state=None, **progress):
+        """
+        Records a state change and/or progress fields of the job.
+        """
+        self.queue.update(self.id, state, **progress)
+
+    def set_output(self, **output):
+        """
+        Records results of the job, persisted with its state so they can be read while it runs and after a restart.
+        """
+        self.output.update(output)
+        self.queue.set_output(self.id, self.output)
+
+    def add_part(self, part, **output):
+        """
+        Records the output of one part of the job, e.g. the chunks of an indexed part, without rewriting the outputs
+        of the parts before it.
+        """
+        self.queue.add_part(self.id, part, output)
+
+
+class JobQueue:
+    """
+    A queue of background jobs run by a local worker pool, with their state persisted in SQLite.
+
+    Job functions are called as function(job, **kwargs) on a worker thread and report their state through
+    job.report. Every job records the process running it, and jobs left unfinished by a process that has stopped
+    are marked failed when a queue is next opened on the database; those of other processes still running are left
+    alone.
+
+    The workers are threads of the process creating the queue, e.g. the Streamlit server, not separate processes.
+    Whisper, torch and the HTTP clients release the GIL while they work, so the jobs do run across cores, but the
+    Python parts of every stage still take turns on the GIL, and torch's thread pool is shared by the whole process.
+    Each job is given an even share of the cores as job.num_threads, so `max_workers` jobs transcribing and encoding
+    at once don't oversubscribe the machine; the share also applies to torch process-wide once a job sets it.
+
+    Attributes:
+        path (str): Path of the SQLite database holding the job states.
+        max_workers (int): Number of jobs run at the same time.
+        threads_per_job (int): CPU threads each job's CPU-bound stages should use.
+        owner (str): The host and process id recorded with the jobs this queue runs.
+    """
+
+    def __init__(self, path='jobs.db', max_workers=2):
+        """
+        Opens the job database and starts the worker pool.
+
+        Args:
+            path (str): Path of the SQLite database holding the job states.
+            max_workers (int): Number of jobs run at the same time, on worker threads.
+        """
+        self.path = path
+        self.max_workers = max_workers
+        self.threads_per_job = max(1, (os.cpu_count() or 1) // max_workers)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, description TEXT, state TEXT NOT NULL, '
+            'progress TEXT NOT NULL, error TEXT, created REAL NOT NULL, updated REAL NOT NULL, output TEXT)'
+        )
+        # Databases created before outputs and owners were persisted
+        columns = [column[1] for column in self._conn.execute('PRAGMA table_info(jobs)')]
+        for column in ('output', 'owner'):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS job_parts (job_id TEXT NOT NULL, part INTEGER NOT NULL, output TEXT NOT NULL, '
+            'PRIMARY KEY (job_id, part))'
+        )
+        self._conn.commit()
+        self._fail_orphaned_jobs()
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+
+    def submit(self, function, description='', **kwargs):
+        """
+        Queues function(job, **kwargs) and returns the id of the new job.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (id, description, state, progress, created, updated, owner) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, description, 'queued', '{}', now, now, self.owner)
+            )
+            self._conn.commit()
+
+        job = Job(self, job_id)
+        self._executor.submit(self._run, job, function, kwargs)
+
+        return job_id
+
+    def update(self, job_id, state=None, error=None, **progress):
+        if state is not None and state not in JOB_STATES:
+            raise ValueError(f"Unknown job state {state}, expected one of {JOB_STATES}.")
+
+        with self._lock:
+            row = self._conn.execute('SELECT state, progress FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            current = json.loads(row[1])
+            current.update(progress)
+            self._conn.execute(
+                'UPDATE jobs SET state = ?, progress = ?, error = COALESCE(?, error), updated = ? WHERE id = ?',
+                (state or row[0], json.dumps(current), error, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def get(self, job_id):
+        """
+        Returns the persisted state of a job as a dictionary, or None if there is no such job.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT id, description, state, progress, error, created, updated FROM jobs WHERE id = ?', (job_id,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, states=None):
+        """
+        Returns the persisted jobs, newest first, optionally only those in the given states.
+        """
+        query = 'SELECT id, description, state, progress, error, created, updated FROM jobs'
+        params = []
+        if states:
+            query += f" WHERE state IN ({','.join('?' * len(states))})"
+            params = list(states)
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY created DESC', params).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def set_output(self, job_id, output):
+        with self._lock:
+            self._conn.execute(
+                'UPDATE jobs SET output = ?, updated = ? WHERE id = ?',
+                (json.dumps(output, default=self._to_json), time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def output(self, job_id):
+        """
+        Returns the persisted output of a job, or an empty dict if it has none yet.
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT output FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else {}
+
+    def add_part(self, job_id, part, output):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO job_parts (job_id, part, output) VALUES (?, ?, ?)',
+                (job_id, part, json.dumps(output, default=self._to_json))
+            )
+            self._conn.execute('UPDATE jobs SET updated = ? WHERE id = ?', (time.time(), job_id))
+            self._conn.commit()
+
+    def parts(self, job_id, start=0):
+        """
+        Returns the outputs of the parts of a job recorded from part `start` on, in part order.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT output FROM job_parts WHERE job_id = ? AND part >= ? ORDER BY part', (job_id, start)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _fail_orphaned_jobs(self):
+        # The workers of a stopped process are gone, so its unfinished jobs never will finish. Other processes
+        # sharing the database open their queues at the same time, so the jobs are picked and failed in one
+        # write transaction.
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self._conn.execute(
+                    'SELECT id, owner FROM jobs WHERE state NOT IN (?, ?)', FINISHED_STATES
+                ).fetchall()
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE jobs SET state = 'failed', error = 'Interrupted by a restart.', updated = ? WHERE id = ?",
+                    [(now, job_id) for job_id, owner in rows if not self._is_running(owner)]
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    @staticmethod
+    def _is_running(owner):
+        # jobs recorded before owners were have none
+        if not owner:
+            return False
+        host, pid = owner.rsplit(':', 1)
+        # a process on another host can't be checked from here
+        if host != socket.gethostname():
+            return True
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # running, under another user
+            return True
+        return True
+
+    def _run(self, job, function, kwargs):
+        try:
+            function(job, **kwargs)
+            self.update(job.id, 'done')
+        except Exception as e:
+            self.update(job.id, 'failed', error=str(e))
+
+    @staticmethod
+    def _to_json(value):
+        # numpy arrays and torch tensors, e.g. the title vector and similarity of a found episode
+        return value.tolist() if hasattr(value, 'tolist') else str(value)
+
+    @staticmethod
+    def _to_dict(row):
+        job_id, description, state, progress, error, created, updated = row
+        return {
+            'id': job_id,
+            'description': description,
+            'state': state,
+            'progress': json.loads(progress),
+            'error': error,
+            'created': created,
+            'updated': updated
+        }
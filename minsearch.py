@@ -1,41 +1,101 @@
+import json
+import os
+import shutil
+import tempfile
+from collections import Counter, defaultdict
+
 import pandas as pd
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer, TfidfTransformer
+from sklearn.metrics.pairwise import cosine_similarity, linear_kernel
+from sklearn.preprocessing import normalize
 
 import numpy as np
 
+# Bumped whenever the on-disk layout written by Index.save changes
+SNAPSHOT_VERSION = 2
+# Same for HybridIndex.save, which holds an Index snapshot of its own
+HYBRID_SNAPSHOT_VERSION = 1
+
+
+def _make_snapshot_dir(target):
+    # written next to the target, so it can be renamed over it
+    parent = os.path.dirname(os.path.abspath(target))
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f".{os.path.basename(os.path.abspath(target))}.", dir=parent)
+
+
+def _swap_snapshot_dir(path, target):
+    # A directory can't be renamed over a non-empty one, so the old snapshot is moved aside first
+    if os.path.exists(target):
+        old = f"{path}.old"
+        os.rename(target, old)
+        os.rename(path, target)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        os.rename(path, target)
+
 
 class Index:
     """
-    A simple search index using TF-IDF and cosine similarity for text fields and exact matching for keyword fields.
+    A simple search index using TF-IDF and cosine similarity (or BM25) for text fields and exact matching for keyword fields.
 
     Attributes:
         text_fields (list): List of text field names to index.
         keyword_fields (list): List of keyword field names to index.
-        vectorizers (dict): Dictionary of TfidfVectorizer instances for each text field.
+        engine (str): Scoring engine, 'tfidf' or 'bm25'.
+        vectorizers (dict): Dictionary of TfidfVectorizer (CountVectorizer for BM25) instances for each text field.
         keyword_df (pd.DataFrame): DataFrame containing keyword field data.
-        text_matrices (dict): Dictionary of TF-IDF matrices for each text field.
+        keyword_index (dict): For every keyword field, a dictionary mapping each value to the sorted array of rows holding it.
+        text_matrices (dict): Dictionary of TF-IDF matrices (raw term counts for BM25) for each text field.
         docs (list): List of documents indexed.
+        deleted (np.ndarray): Boolean mask of removed (tombstoned) rows, aligned with docs.
+        idf_drift (float): Fraction of changed documents after which IDF weights are recomputed.
     """
 
-    def __init__(self, index_name, text_fields, keyword_fields, vectorizer_params={}):
+    def __init__(self, index_name, text_fields, keyword_fields, vectorizer_params={}, idf_drift=0.1, engine='tfidf', k1=1.2, b=0.75):
         """
         Initializes the Index with specified text and keyword fields.
 
         Args:
             text_fields (list): List of text field names to index.
             keyword_fields (list): List of keyword field names to index.
-            vectorizer_params (dict): Optional parameters to pass to TfidfVectorizer.
+            vectorizer_params (dict): Optional parameters to pass to TfidfVectorizer (CountVectorizer for BM25).
+            idf_drift (float): Recompute IDF weights once the number of documents added or removed since the
+                last refresh exceeds this fraction of the live documents. Use 0 to refresh on every change.
+            engine (str): 'tfidf' to score with TF-IDF and cosine similarity over the whole corpus, or 'bm25' to
+                score with BM25 over an inverted index, touching only the postings of the query terms.
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 document length normalization.
         """
+        if engine not in ('tfidf', 'bm25'):
+            raise ValueError(f"Unknown engine {engine}, expected 'tfidf' or 'bm25'.")
+
         self.index_name = index_name
         self.text_fields = text_fields
         self.keyword_fields = keyword_fields
+        self.vectorizer_params = vectorizer_params
+        self.idf_drift = idf_drift
+        self.engine = engine
+        self.k1 = k1
+        self.b = b
 
-        self.vectorizers = {field: TfidfVectorizer(**vectorizer_params) for field in text_fields}
+        vectorizer_class = TfidfVectorizer if engine == 'tfidf' else CountVectorizer
+        self.vectorizers = {field: vectorizer_class(**vectorizer_params) for field in text_fields}
         self.keyword_df = None
+        self.keyword_index = {}
         self.text_matrices = {}
         self.docs = []
+        self.deleted = np.zeros(0, dtype=bool)
+
+        # Live document frequency of every term and number of documents changed since the IDF was computed
+        self._doc_freqs = {}
+        self._pending = 0
+        # BM25 posting lists (CSC impact matrix) and per-term upper bounds, rebuilt lazily after every change
+        self._postings = {}
+        # Keyword values sorted for range filters, built lazily per field
+        self._keyword_ranges = {}
 
     def fit(self, docs):
         """
@@ -50,15 +110,212 @@ class Index:
         for field in self.text_fields:
             texts = [doc.get(field, '') for doc in docs]
             self.text_matrices[field] = self.vectorizers[field].fit_transform(texts)
+            self._doc_freqs[field] = self._document_frequencies(self.text_matrices[field])
 
         for doc in docs:
             for field in self.keyword_fields:
                 keyword_data[field].append(doc.get(field, ''))
 
         self.keyword_df = pd.DataFrame(keyword_data)
+        self.keyword_index = {field: self._build_keyword_index(keyword_data[field]) for field in self.keyword_fields}
+        self._keyword_ranges = {}
+        self.deleted = np.zeros(len(docs), dtype=bool)
+        self._pending = 0
+        self._postings = {}
+
+        return self
+
+    def add(self, docs):
+        """
+        Appends documents to a fitted index without refitting the existing ones.
+
+        Only the new documents are tokenized. Terms that aren't in the vocabulary yet are appended to it,
+        and the IDF weights of the existing rows are refreshed once the `idf_drift` threshold is reached.
+
+        Args:
+            docs (list of dict): List of documents to add. Each document is a dictionary.
+        """
+        docs = list(docs)
+        if not docs:
+            return self
+        if not self._doc_freqs:
+            return self.fit(docs)
+
+        for field in self.text_fields:
+            counts = self._count_terms(field, [doc.get(field, '') for doc in docs])
+            n_terms = counts.shape[1]
+
+            doc_freqs = np.zeros(n_terms, dtype=np.int64)
+            doc_freqs[:len(self._doc_freqs[field])] = self._doc_freqs[field]
+            doc_freqs += self._document_frequencies(counts)
+            self._doc_freqs[field] = doc_freqs
+
+            if self.engine == 'tfidf':
+                counts = self._weight_counts(field, counts, len(self.docs) - self.deleted.sum() + len(docs))
+
+            matrix = self.text_matrices[field]
+            matrix = sparse.csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(matrix.shape[0], n_terms))
+            self.text_matrices[field] = sparse.vstack([matrix, counts], format='csr')
+
+        keyword_data = {field: [doc.get(field, '') for doc in docs] for field in self.keyword_fields}
+        self.keyword_df = pd.concat([self.keyword_df, pd.DataFrame(keyword_data)], ignore_index=True)
+        for field in self.keyword_index:
+            # New rows come after all existing ones, so appending keeps every row array sorted
+            for value, rows in self._build_keyword_index(keyword_data[field], offset=len(self.docs)).items():
+                existing = self.keyword_index[field].get(value)
+                self.keyword_index[field][value] = rows if existing is None else np.concatenate([existing, rows])
+        self._keyword_ranges = {}
+        self.docs = self.docs + docs
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(docs), dtype=bool)])
+
+        self._pending += len(docs)
+        self._postings = {}
+        self._maybe_refresh()
 
         return self
 
+    def remove(self, ids, id_field='id', filter_dict=None):
+        """
+        Removes documents from the index by tombstoning their rows.
+
+        Removed rows are excluded from search right away and physically dropped on the next refresh.
+
+        Args:
+            ids (list): Values of `id_field` of the documents to remove.
+            id_field (str): Keyword field holding the document ids.
+            filter_dict (dict): Optional keyword filters the documents must also match, e.g. their episode
+                when ids are only unique within one.
+
+        Returns:
+            int: The number of documents removed.
+        """
+        if id_field not in self.keyword_fields:
+            raise ValueError(f"{id_field} is not a keyword field of index {self.index_name}.")
+
+        rows = self._filter_rows({**(filter_dict or {}), id_field: list(ids)})
+        if len(rows) == 0:
+            return 0
+
+        for field in self.text_fields:
+            removed = self.text_matrices[field][rows]
+            self._doc_freqs[field] = self._doc_freqs[field] - self._document_frequencies(removed)
+
+        self.deleted = self.deleted.copy()
+        self.deleted[rows] = True
+
+        self._pending += len(rows)
+        self._postings = {}
+        self._maybe_refresh()
+
+        return len(rows)
+
+    def refresh(self):
+        """
+        Recomputes the IDF weights from the live documents and drops the tombstoned rows.
+
+        The text matrices are reweighted in place of being refitted, so no document is tokenized again.
+        """
+        live = ~self.deleted
+        n_docs = int(live.sum())
+
+        for field in self.text_fields:
+            vectorizer = self.vectorizers[field]
+            matrix = self.text_matrices[field][live] if not live.all() else self.text_matrices[field]
+
+            if self.engine == 'tfidf' and vectorizer.use_idf:
+                idf = self._compute_idf(field, n_docs)
+                matrix = matrix @ sparse.diags(idf / vectorizer.idf_)
+                if vectorizer.norm and n_docs:
+                    matrix = normalize(matrix, norm=vectorizer.norm)
+                self._update_vectorizer(vectorizer, idf)
+
+            self.text_matrices[field] = sparse.csr_matrix(matrix)
+
+        if not live.all():
+            self.docs = [doc for doc, keep in zip(self.docs, live) if keep]
+            self.keyword_df = self.keyword_df[live].reset_index(drop=True)
+            self.keyword_index = {}
+            self._keyword_ranges = {}
+            self.deleted = np.zeros(n_docs, dtype=bool)
+
+        self._pending = 0
+        self._postings = {}
+
+        return self
+
+    def _maybe_refresh(self):
+        n_live = len(self.docs) - int(self.deleted.sum())
+        if self._pending > self.idf_drift * max(n_live, 1):
+            self.refresh()
+
+    def _count_terms(self, field, texts):
+        """
+        Builds the raw term-count matrix of `texts`, extending the vocabulary of the field with unseen terms.
+        """
+        vectorizer = self.vectorizers[field]
+        analyzer = vectorizer.build_analyzer()
+        vocabulary = vectorizer.vocabulary_
+
+        indices, values, indptr = [], [], [0]
+        for text in texts:
+            counts = Counter()
+            for term in analyzer(text):
+                if term not in vocabulary:
+                    vocabulary[term] = len(vocabulary)
+                counts[vocabulary[term]] += 1
+            indices.extend(counts.keys())
+            values.extend(counts.values())
+            indptr.append(len(indices))
+
+        return sparse.csr_matrix(
+            (np.array(values, dtype=np.float64), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int32)),
+            shape=(len(texts), len(vocabulary))
+        )
+
+    def _weight_counts(self, field, counts, n_docs):
+        """
+        Turns raw term counts of new documents into TF-IDF rows matching the vectorizer of the field.
+        """
+        vectorizer = self.vectorizers[field]
+        idf = None
+
+        if vectorizer.sublinear_tf:
+            counts.data = np.log(counts.data) + 1
+        if vectorizer.use_idf:
+            # Existing terms keep the weights the matrix was built with until the next refresh
+            idf = self._compute_idf(field, n_docs)
+            idf[:len(vectorizer.idf_)] = vectorizer.idf_
+            counts = counts @ sparse.diags(idf)
+        self._update_vectorizer(vectorizer, idf)
+        if vectorizer.norm:
+            counts = normalize(counts, norm=vectorizer.norm)
+
+        return counts
+
+    def _compute_idf(self, field, n_docs):
+        """
+        IDF weights from the live document frequencies, using the same formula as TfidfTransformer.
+        """
+        doc_freqs = self._doc_freqs[field].astype(np.float64)
+        if self.vectorizers[field].smooth_idf:
+            return np.log((1 + n_docs) / (1 + doc_freqs)) + 1
+        return np.log(max(n_docs, 1) / np.maximum(doc_freqs, 1)) + 1
+
+    @staticmethod
+    def _update_vectorizer(vectorizer, idf=None):
+        """
+        Syncs a fitted vectorizer with its extended vocabulary and, when given, new IDF weights.
+        """
+        if idf is not None:
+            vectorizer.idf_ = idf
+        # The inner TfidfTransformer checks the query width against the width it was fitted on
+        vectorizer._tfidf.n_features_in_ = len(vectorizer.vocabulary_)
+
+    @staticmethod
+    def _document_frequencies(matrix):
+        matrix = sparse.csr_matrix(matrix)
+        return np.bincount(matrix.indices, minlength=matrix.shape[1])
+
     def search(self, query, filter_dict={}, boost_dict={}, num_results=10):
         """
         Searches the index with the given query, filters, and boost parameters.
@@ -72,26 +329,696 @@ class Index:
         Returns:
             list of dict: List of documents matching the search criteria, ranked by relevance.
         """
+        top_rows, _ = self.search_rows(query, filter_dict, boost_dict, num_results)
+
+        return [self.docs[i] for i in top_rows]
+
+    def search_rows(self, query, filter_dict={}, boost_dict={}, num_results=10):
+        """
+        Same as `search`, but returns the rows of the matching documents and their scores.
+
+        Returns:
+            tuple of np.ndarray: Rows of the documents matching the search criteria and their scores, ranked by relevance.
+        """
+        if self.engine == 'bm25':
+            return self._bm25_search(query, filter_dict, boost_dict, num_results)
+
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0))
+
+        # Only the rows passing the keyword filters are scored
+        rows = self._filter_rows(filter_dict)
+        if rows is not None and len(rows) == 0:
+            return empty
+
         query_vecs = {field: self.vectorizers[field].transform([query]) for field in self.text_fields}
-        scores = np.zeros(len(self.docs))
+        scores = np.zeros(len(self.docs) if rows is None else len(rows))
 
         # Compute cosine similarity for each text field and apply boost
         for field, query_vec in query_vecs.items():
-            sim = cosine_similarity(query_vec, self.text_matrices[field]).flatten()
+            sim = self._similarity(field, query_vec, rows).flatten()
             boost = boost_dict.get(field, 1)
             scores += sim * boost
 
-        # Apply keyword filters
-        for field, value in filter_dict.items():
-            if field in self.keyword_fields:
-                mask = self.keyword_df[field] == value
-                scores = scores * mask.to_numpy()
+        # Skip removed documents
+        if rows is None and self.deleted.any():
+            scores = scores * ~self.deleted
+
+        num_results = min(num_results, len(scores))
+        if num_results <= 0:
+            return empty
 
         # Use argpartition to get top num_results indices
         top_indices = np.argpartition(scores, -num_results)[-num_results:]
         top_indices = top_indices[np.argsort(-scores[top_indices])]
 
         # Filter out zero-score results
-        top_docs = [self.docs[i] for i in top_indices if scores[i] > 0]
+        top_indices = top_indices[scores[top_indices] > 0]
+        top_rows = top_indices if rows is None else rows[top_indices]
+
+        return top_rows, scores[top_indices]
+
+    def search_many(self, queries, filter_dict={}, boost_dict={}, num_results=10, batch_size=256):
+        """
+        Searches the index with several queries at once.
+
+        All queries of a batch are vectorized in one call and scored with one sparse matrix product per
+        text field, and the top results of every query are selected with a row-wise argpartition.
+
+        Args:
+            queries (list of str): The search query strings.
+            filter_dict (dict or list of dict): Keyword filters shared by all queries, or one dictionary per query.
+            boost_dict (dict): Dictionary of boost scores for text fields. Keys are field names and values are the boost scores.
+            num_results (int): The number of top results to return per query. Defaults to 10.
+            batch_size (int): Number of queries scored together, bounding the dense score matrix to batch_size x len(docs).
+
+        Returns:
+            list of list of dict: For every query, the documents matching the search criteria, ranked by relevance.
+        """
+        queries = list(queries)
+        shared_filters = isinstance(filter_dict, dict)
+        if shared_filters:
+            # Shared filters restrict the scored columns to the surviving rows
+            rows = self._filter_rows(filter_dict)
+        elif len(filter_dict) != len(queries):
+            raise ValueError("filter_dict must be a dictionary or a list with one dictionary per query.")
+        else:
+            rows = None
+
+        n_columns = len(self.docs) if rows is None else len(rows)
+        num_results = min(num_results, n_columns)
+        if num_results <= 0:
+            return [[] for _ in queries]
+        results = []
+
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            scores = np.zeros((len(batch), n_columns))
+
+            for field in self.text_fields:
+                query_vecs = self.vectorizers[field].transform(batch)
+                scores += self._similarity(field, query_vecs, rows) * boost_dict.get(field, 1)
+
+            if not shared_filters:
+                scores *= np.vstack([self._filter_mask(filters) for filters in filter_dict[start:start + batch_size]])
+            elif rows is None and self.deleted.any():
+                scores *= ~self.deleted
+
+            # Row-wise top num_results, then sort only those
+            top_indices = np.argpartition(-scores, num_results - 1, axis=1)[:, :num_results]
+            top_scores = np.take_along_axis(scores, top_indices, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            top_indices = np.take_along_axis(top_indices, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+            if rows is not None:
+                top_indices = rows[top_indices]
+
+            for indices, row_scores in zip(top_indices, top_scores):
+                results.append([self.docs[i] for i, score in zip(indices, row_scores) if score > 0])
+
+        return results
+
+    def _filter_rows(self, filter_dict):
+        """
+        Sorted array of the rows that pass the keyword filters and haven't been removed.
+
+        A filter value can be a single value to match exactly, a list, tuple or set of values to match any of,
+        or a dictionary of range bounds ('gt', 'gte', 'lt', 'lte') for numeric fields.
+
+        Returns:
+            np.ndarray or None: The surviving rows, or None if no filter applies.
+        """
+        rows = None
+        for field, value in filter_dict.items():
+            if field not in self.keyword_fields:
+                continue
+
+            if isinstance(value, dict):
+                field_rows = self._range_rows(field, value)
+            elif isinstance(value, (list, tuple, set)):
+                index = self._keyword_rows(field)
+                matches = [index[item] for item in value if item in index]
+                field_rows = np.unique(np.concatenate(matches)) if matches else np.zeros(0, dtype=np.int64)
+            else:
+                field_rows = self._keyword_rows(field).get(value, np.zeros(0, dtype=np.int64))
+
+            rows = field_rows if rows is None else np.intersect1d(rows, field_rows, assume_unique=True)
+
+        if rows is not None and self.deleted.any():
+            rows = rows[~self.deleted[rows]]
+
+        return rows
+
+    def _filter_mask(self, filter_dict):
+        """
+        Boolean mask of the documents that pass the keyword filters and haven't been removed.
+        """
+        rows = self._filter_rows(filter_dict)
+        if rows is None:
+            return ~self.deleted
+
+        mask = np.zeros(len(self.docs), dtype=bool)
+        mask[rows] = True
+        return mask
+
+    def _keyword_rows(self, field):
+        """
+        Value to rows index of a keyword field, built on first use after a load or a refresh.
+        """
+        if field not in self.keyword_index:
+            self.keyword_index[field] = self._build_keyword_index(self.keyword_df[field].tolist())
+        return self.keyword_index[field]
+
+    def _range_rows(self, field, bounds):
+        """
+        Sorted array of the rows whose numeric value of `field` lies within `bounds`.
+        """
+        if field not in self._keyword_ranges:
+            values = pd.to_numeric(self.keyword_df[field], errors='coerce').to_numpy(dtype=np.float64)
+            order = np.argsort(values, kind='stable')
+            self._keyword_ranges[field] = (values[order], order)
+
+        sorted_values, order = self._keyword_ranges[field]
+        # NaN (non-numeric) values sort last and never match
+        start, end = 0, np.searchsorted(sorted_values, np.inf, side='right')
+        if 'gte' in bounds:
+            start = max(start, np.searchsorted(sorted_values, bounds['gte'], side='left'))
+        if 'gt' in bounds:
+            start = max(start, np.searchsorted(sorted_values, bounds['gt'], side='right'))
+        if 'lte' in bounds:
+            end = min(end, np.searchsorted(sorted_values, bounds['lte'], side='right'))
+        if 'lt' in bounds:
+            end = min(end, np.searchsorted(sorted_values, bounds['lt'], side='left'))
+
+        return np.sort(order[start:end]) if start < end else np.zeros(0, dtype=np.int64)
+
+    @staticmethod
+    def _is_numeric_column(values):
+        present = [value for value in values if value is not None and not (isinstance(value, str) and value == '')]
+        return bool(present) and all(isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_)) for value in present)
+
+    @staticmethod
+    def _build_keyword_index(values, offset=0):
+        row_ids = defaultdict(list)
+        for row, value in enumerate(values, start=offset):
+            # Lists (e.g. timestamp pairs) aren't hashable
+            row_ids[tuple(value) if isinstance(value, list) else value].append(row)
+        return {value: np.array(rows, dtype=np.int64) for value, rows in row_ids.items()}
+
+    def _bm25_search(self, query, filter_dict, boost_dict, num_results):
+        """
+        Term-at-a-time BM25 search with MaxScore pruning.
+
+        Posting lists are processed from the highest to the lowest score upper bound. Once the bounds of the
+        remaining lists can't lift an unseen document above the current top `num_results`, those lists are only
+        probed for the documents already collected, and candidates that can no longer make it are dropped.
+        """
+        # Tombstoned rows are left out of the postings, so only keyword filters need a mask
+        rows = self._filter_rows(filter_dict)
+        mask = None
+        if rows is not None:
+            mask = np.zeros(len(self.docs), dtype=bool)
+            mask[rows] = True
+
+        postings_lists = []
+        for field in self.text_fields:
+            postings, upper_bounds = self._bm25_postings(field)
+            query_vec = self.vectorizers[field].transform([query])
+            boost = boost_dict.get(field, 1)
+
+            for term, query_tf in zip(query_vec.indices, query_vec.data):
+                start, end = postings.indptr[term], postings.indptr[term + 1]
+                if start == end:
+                    continue
+                weight = query_tf * boost
+                postings_lists.append((upper_bounds[term] * weight, weight, postings.indices[start:end], postings.data[start:end]))
+
+        if num_results <= 0 or not postings_lists:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        postings_lists.sort(key=lambda postings_list: -postings_list[0])
+        remaining_bounds = np.cumsum([postings_list[0] for postings_list in postings_lists][::-1])[::-1]
+
+        candidates = np.zeros(0, dtype=np.int64)
+        scores = np.zeros(0)
+        threshold = 0.0
+
+        for (_, weight, doc_ids, impacts), remaining_bound in zip(postings_lists, remaining_bounds):
+            if len(scores) >= num_results and remaining_bound <= threshold:
+                alive = scores + remaining_bound > threshold
+                candidates, scores = candidates[alive], scores[alive]
+
+                positions = np.searchsorted(doc_ids, candidates)
+                clipped = np.minimum(positions, len(doc_ids) - 1)
+                hits = (positions < len(doc_ids)) & (doc_ids[clipped] == candidates)
+                scores[hits] += impacts[clipped[hits]] * weight
+            else:
+                if mask is not None:
+                    keep = mask[doc_ids]
+                    doc_ids, impacts = doc_ids[keep], impacts[keep]
+                candidates, inverse = np.unique(np.concatenate([candidates, doc_ids]), return_inverse=True)
+                scores = np.bincount(inverse, weights=np.concatenate([scores, impacts * weight]), minlength=len(candidates))
+
+            if len(scores) >= num_results:
+                threshold = np.partition(scores, -num_results)[-num_results]
+
+        top_indices = np.argsort(-scores, kind='stable')[:num_results]
+        top_indices = top_indices[scores[top_indices] > 0]
+
+        return candidates[top_indices], scores[top_indices]
+
+    def _bm25_postings(self, field):
+        """
+        Posting lists of a text field as a CSC matrix of BM25 term impacts, plus the maximum impact of every term.
+        """
+        if field not in self._postings:
+            counts = sparse.csr_matrix(self.text_matrices[field])
+            live = ~self.deleted
+            n_docs = int(live.sum())
+
+            doc_lengths = np.asarray(counts.sum(axis=1)).ravel()
+            avg_length = doc_lengths[live].mean() if n_docs else 1.0
+            doc_freqs = self._doc_freqs[field]
+            idf = np.log(1 + (n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5))
+
+            rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+            tf = counts.data
+            length_norm = self.k1 * (1 - self.b + self.b * doc_lengths[rows] / max(avg_length, 1e-9))
+            impacts = idf[counts.indices] * tf * (self.k1 + 1) / (tf + length_norm)
+            impacts[~live[rows]] = 0
+
+            matrix = sparse.csr_matrix((impacts, counts.indices.copy(), counts.indptr.copy()), shape=counts.shape)
+            matrix.eliminate_zeros()
+            postings = matrix.tocsc()
+            postings.sort_indices()
+            upper_bounds = postings.max(axis=0).toarray().ravel()
+
+            self._postings[field] = (postings, upper_bounds)
+
+        return self._postings[field]
+
+    def _similarity(self, field, query_vec, rows=None):
+        """
+        Cosine similarity between query vectors and the matrix of a text field (BM25 scores for the BM25 engine),
+        restricted to `rows` when given.
+
+        TF-IDF rows are already L2-normalised by default, in which case a plain dot product is used so
+        that the (possibly memory-mapped) document matrix is never copied.
+        """
+        if self.engine == 'bm25':
+            # Row slicing a CSC matrix costs more than scoring every column of it
+            sim = linear_kernel(query_vec, self._bm25_postings(field)[0])
+            return sim if rows is None else sim[:, rows]
+
+        matrix = self.text_matrices[field] if rows is None else self.text_matrices[field][rows]
+        if self.vectorizers[field].norm == 'l2':
+            return linear_kernel(query_vec, matrix)
+        return cosine_similarity(query_vec, matrix)
+
+    def save(self, path):
+        """
+        Writes a snapshot of the fitted index to a directory.
+
+        The snapshot holds the vocabulary and IDF weights of every vectorizer, the CSR arrays
+        (data/indices/indptr) of every text matrix and the keyword columns as .npy files, plus the
+        documents and the index settings as JSON. Numeric keyword columns with missing values (None or '') are stored
+        as floats with NaN for the missing ones; other keyword columns with mixed value types are stored as strings.
+
+        The snapshot is written to a temporary directory next to `path` and swapped in once complete, so an existing
+        snapshot is never left half overwritten. Readers racing with a save can find no snapshot for the instant of
+        the swap, so processes sharing a snapshot should serialize their loads and saves with a lock.
+
+        Args:
+            path (str): Directory to write the snapshot to. Created if it doesn't exist.
+
+        Returns:
+            str: The snapshot directory.
+        """
+        target = path
+        path = _make_snapshot_dir(target)
+
+        fields = {}
+        for field in self.text_fields:
+            vectorizer = self.vectorizers[field]
+            matrix = sparse.csr_matrix(self.text_matrices[field])
+            terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+
+            np.save(os.path.join(path, f"{field}.vocab.npy"), np.array(terms, dtype=str))
+            if self.engine == 'tfidf' and vectorizer.use_idf:
+                np.save(os.path.join(path, f"{field}.idf.npy"), vectorizer.idf_)
+            np.save(os.path.join(path, f"{field}.data.npy"), matrix.data)
+            np.save(os.path.join(path, f"{field}.indices.npy"), matrix.indices)
+            np.save(os.path.join(path, f"{field}.indptr.npy"), matrix.indptr)
+            np.save(os.path.join(path, f"{field}.df.npy"), self._doc_freqs[field])
+            fields[field] = {'shape': list(matrix.shape)}
+
+        for field in self.keyword_fields:
+            values = self.keyword_df[field].tolist()
+            column = np.asarray(values)
+            if column.dtype == object and self._is_numeric_column(values):
+                # e.g. sentence times, missing for untimed transcripts: range filters skip NaN
+                column = np.array([np.nan if value is None or value == '' else value for value in values], dtype=np.float64)
+            elif column.dtype == object:
+                column = column.astype(str)
+            np.save(os.path.join(path, f"{field}.keyword.npy"), column)
+
+        np.save(os.path.join(path, 'deleted.npy'), self.deleted)
+
+        meta = {
+            'version': SNAPSHOT_VERSION,
+            'index_name': self.index_name,
+            'text_fields': self.text_fields,
+            'keyword_fields': self.keyword_fields,
+            'vectorizer_params': self.vectorizer_params,
+            'idf_drift': self.idf_drift,
+            'engine': self.engine,
+            'k1': self.k1,
+            'b': self.b,
+            'pending': self._pending,
+            'fields': fields,
+        }
+
+        with open(os.path.join(path, 'docs.json'), 'w') as f:
+            json.dump(self.docs, f)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        _swap_snapshot_dir(path, target)
+
+        return target
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads an index snapshot written by `save` without re-tokenizing the documents.
+
+        Args:
+            path (str): Snapshot directory.
+            mmap (bool): Memory-map the matrix and keyword arrays read-only instead of reading them into memory,
+                so that several processes serving the same snapshot share one copy through the page cache.
+
+        Returns:
+            Index: The loaded index, ready for searching.
+        """
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+
+        version = meta.get('version')
+        if version not in (1, SNAPSHOT_VERSION):
+            raise ValueError(f"Unsupported snapshot version {version} in {path}, expected {SNAPSHOT_VERSION}.")
+
+        mmap_mode = 'r' if mmap else None
+        index = cls(
+            index_name=meta['index_name'],
+            text_fields=meta['text_fields'],
+            keyword_fields=meta['keyword_fields'],
+            vectorizer_params=meta['vectorizer_params'],
+            idf_drift=meta.get('idf_drift', 0.1),
+            engine=meta.get('engine', 'tfidf'),
+            k1=meta.get('k1', 1.2),
+            b=meta.get('b', 0.75)
+        )
+
+        for field in index.text_fields:
+            terms = np.load(os.path.join(path, f"{field}.vocab.npy"))
+            vectorizer = index.vectorizers[field]
+            vectorizer.vocabulary_ = dict(zip(terms.tolist(), range(len(terms))))
+            vectorizer.fixed_vocabulary_ = False
+            if index.engine == 'tfidf' and vectorizer.use_idf:
+                vectorizer.idf_ = np.load(os.path.join(path, f"{field}.idf.npy"))
+            elif index.engine == 'tfidf':
+                vectorizer._tfidf = TfidfTransformer(
+                    norm=vectorizer.norm,
+                    use_idf=False,
+                    smooth_idf=vectorizer.smooth_idf,
+                    sublinear_tf=vectorizer.sublinear_tf
+                ).fit(sparse.csr_matrix((1, len(terms))))
+
+            index.text_matrices[field] = sparse.csr_matrix(
+                (
+                    np.load(os.path.join(path, f"{field}.data.npy"), mmap_mode=mmap_mode),
+                    np.load(os.path.join(path, f"{field}.indices.npy"), mmap_mode=mmap_mode),
+                    np.load(os.path.join(path, f"{field}.indptr.npy"), mmap_mode=mmap_mode)
+                ),
+                shape=tuple(meta['fields'][field]['shape']),
+                copy=False
+            )
+
+            if version == 1:
+                index._doc_freqs[field] = index._document_frequencies(index.text_matrices[field])
+            else:
+                index._doc_freqs[field] = np.load(os.path.join(path, f"{field}.df.npy"))
+
+        index.keyword_df = pd.DataFrame({
+            field: np.load(os.path.join(path, f"{field}.keyword.npy"), mmap_mode=mmap_mode)
+            for field in index.keyword_fields
+        })
+
+        with open(os.path.join(path, 'docs.json'), 'r') as f:
+            index.docs = json.load(f)
+
+        if version == 1:
+            index.deleted = np.zeros(len(index.docs), dtype=bool)
+        else:
+            index.deleted = np.load(os.path.join(path, 'deleted.npy'))
+            index._pending = meta['pending']
+
+        return index
+
+
+class HybridIndex:
+    """
+    A hybrid search index combining the lexical scores of an Index with dense embedding similarity.
+
+    The lexical top `num_candidates` documents are the candidate set: only their embeddings are compared
+    with the query vector, and both rankings are fused with reciprocal rank fusion or a weighted sum.
+
+    Attributes:
+        lexical (Index): The lexical index over the text and keyword fields.
+        vector_field (str): Document field holding the embedding.
+        embeddings (np.ndarray): L2-normalised document embeddings, aligned with lexical.docs.
+        fusion (str): 'rrf' for reciprocal rank fusion or 'weighted' for a weighted sum of normalised scores.
+    """
+
+    def __init__(self, index_name, text_fields, keyword_fields, vector_field='text_vector', vectorizer_params={}, engine='tfidf',
+                 fusion='rrf', rrf_k=60, dense_weight=0.5, num_candidates=100):
+        """
+        Initializes the HybridIndex.
+
+        Args:
+            text_fields (list): List of text field names to index.
+            keyword_fields (list): List of keyword field names to index.
+            vector_field (str): Document field holding the embedding.
+            vectorizer_params (dict): Optional parameters to pass to the lexical vectorizers.
+            engine (str): Lexical scoring engine, 'tfidf' or 'bm25'.
+            fusion (str): 'rrf' for reciprocal rank fusion or 'weighted' for a weighted sum of normalised scores.
+            rrf_k (int): Rank offset of reciprocal rank fusion.
+            dense_weight (float): Weight of the dense score in weighted fusion, between 0 and 1.
+            num_candidates (int): Number of lexical results whose embeddings are scored.
+        """
+        if fusion not in ('rrf', 'weighted'):
+            raise ValueError(f"Unknown fusion {fusion}, expected 'rrf' or 'weighted'.")
+
+        self.index_name = index_name
+        self.vector_field = vector_field
+        self.fusion = fusion
+        self.rrf_k = rrf_k
+        self.dense_weight = dense_weight
+        self.num_candidates = num_candidates
+
+        self.lexical = Index(index_name, text_fields, keyword_fields, vectorizer_params=vectorizer_params, engine=engine)
+        self.embeddings = None
+
+    @property
+    def docs(self):
+        return self.lexical.docs
+
+    def fit(self, docs, embeddings=None):
+        """
+        Fits the index with the provided documents.
+
+        Args:
+            docs (list of dict): List of documents to index. Each document holds its embedding in `vector_field`,
+                unless `embeddings` is given.
+            embeddings (np.ndarray): Optional matrix of document embeddings, row i embedding docs[i].
+        """
+        self.lexical.fit([{k: v for k, v in doc.items() if k != self.vector_field} for doc in docs])
+        if embeddings is None:
+            embeddings = [doc[self.vector_field] for doc in docs]
+        self.embeddings = self._normalize(np.asarray(embeddings, dtype=np.float32))
+
+        return self
+
+    def add(self, docs, embeddings=None):
+        """
+        Appends documents to the index without refitting the existing ones.
+
+        Args:
+            docs (list of dict): List of documents to add. Each document holds its embedding in `vector_field`,
+                unless `embeddings` is given.
+            embeddings (np.ndarray): Optional matrix of document embeddings, row i embedding docs[i].
+        """
+        if self.embeddings is None:
+            return self.fit(docs, embeddings)
+
+        self.lexical.add([{k: v for k, v in doc.items() if k != self.vector_field} for doc in docs])
+        if embeddings is None:
+            embeddings = [doc[self.vector_field] for doc in docs]
+        self.embeddings = np.vstack([self.embeddings, self._normalize(np.asarray(embeddings, dtype=np.float32))])
+
+        return self
+
+    def remove(self, ids, id_field='id', filter_dict=None):
+        """
+        Removes documents from the index, together with their embeddings.
+
+        The lexical index is refreshed right away, so its rows and the embedding rows stay aligned.
+
+        Args:
+            ids (list): Values of `id_field` of the documents to remove.
+            id_field (str): Keyword field holding the document ids.
+            filter_dict (dict): Optional keyword filters the documents must also match.
+
+        Returns:
+            int: The number of documents removed.
+        """
+        rows = self.lexical._filter_rows({**(filter_dict or {}), id_field: list(ids)})
+        if len(rows) == 0:
+            return 0
+
+        live = ~self.lexical.deleted
+        live[rows] = False
+        self.lexical.remove(ids, id_field, filter_dict)
+        self.lexical.refresh()
+        self.embeddings = self.embeddings[live]
+
+        return len(rows)
+
+    def search(self, query, query_vector, filter_dict={}, boost_dict={}, num_results=10, dense_weight=None):
+        """
+        Searches the index with the given query, query embedding, filters, and boost parameters.
+
+        If the lexical search finds fewer than `num_results` documents, the embeddings of all the documents passing
+        the filters are scored, so questions that share no words with the transcript still get answers.
+
+        Args:
+            query (str): The search query string.
+            query_vector (list or np.ndarray): Embedding of the query, from the same encoder as the documents.
+            filter_dict (dict): Dictionary of keyword fields to filter by. Keys are field names and values are the values to filter by.
+            boost_dict (dict): Dictionary of boost scores for text fields. Keys are field names and values are the boost scores.
+            num_results (int): The number of top results to return. Defaults to 10.
+            dense_weight (float): Weight of the dense score in weighted fusion for this query. Defaults to the index's.
+
+        Returns:
+            list of dict: List of documents matching the search criteria, ranked by relevance.
+        """
+        if dense_weight is None:
+            dense_weight = self.dense_weight
+        query_vector = self._normalize(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+        lexical_rows, lexical_scores = self.lexical.search_rows(query, filter_dict, boost_dict, max(self.num_candidates, num_results))
+
+        if len(lexical_rows) >= num_results:
+            candidates, candidate_lexical = lexical_rows, lexical_scores
+        else:
+            candidates = self.lexical._filter_rows(filter_dict)
+            if candidates is None:
+                candidates = np.flatnonzero(~self.lexical.deleted)
+            # Lexical score of every candidate, 0 for those the lexical search didn't return
+            all_lexical = np.zeros(len(self.docs))
+            all_lexical[lexical_rows] = lexical_scores
+            candidate_lexical = all_lexical[candidates]
+        if len(candidates) == 0:
+            return []
+
+        dense_scores = self.embeddings[candidates] @ query_vector
+
+        if self.fusion == 'rrf':
+            lexical_ranks = np.full(len(candidates), np.inf)
+            ranked = candidate_lexical > 0
+            lexical_ranks[np.argsort(-candidate_lexical, kind='stable')[:ranked.sum()]] = np.arange(1, ranked.sum() + 1)
+            dense_ranks = np.empty(len(candidates))
+            dense_ranks[np.argsort(-dense_scores, kind='stable')] = np.arange(1, len(candidates) + 1)
+            scores = 1 / (self.rrf_k + lexical_ranks) + 1 / (self.rrf_k + dense_ranks)
+        else:
+            max_lexical = candidate_lexical.max()
+            normalized_lexical = candidate_lexical / max_lexical if max_lexical > 0 else candidate_lexical
+            scores = (1 - dense_weight) * normalized_lexical + dense_weight * (dense_scores + 1) / 2
+
+        top_indices = np.argsort(-scores, kind='stable')[:num_results]
+
+        return [self.docs[candidates[i]] for i in top_indices]
+
+    def save(self, path):
+        """
+        Writes a snapshot of the fitted index to a directory: the snapshot of the lexical index in `lexical`, the
+        embeddings as a .npy file and the fusion settings as JSON. It is swapped in once complete, as in Index.save.
+
+        Args:
+            path (str): Directory to write the snapshot to. Created if it doesn't exist.
+
+        Returns:
+            str: The snapshot directory.
+        """
+        target = path
+        path = _make_snapshot_dir(target)
+
+        self.lexical.save(os.path.join(path, 'lexical'))
+        np.save(os.path.join(path, 'embeddings.npy'), self.embeddings)
+
+        meta = {
+            'version': HYBRID_SNAPSHOT_VERSION,
+            'index_name': self.index_name,
+            'vector_field': self.vector_field,
+            'fusion': self.fusion,
+            'rrf_k': self.rrf_k,
+            'dense_weight': self.dense_weight,
+            'num_candidates': self.num_candidates,
+        }
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        _swap_snapshot_dir(path, target)
+
+        return target
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads a snapshot written by `save`.
+
+        Args:
+            path (str): Snapshot directory.
+            mmap (bool): Memory-map the arrays read-only instead of reading them into memory, as in Index.load.
+
+        Returns:
+            HybridIndex: The loaded index, ready for searching.
+        """
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+
+        version = meta.get('version')
+        if version != HYBRID_SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported hybrid snapshot version {version} in {path}, expected {HYBRID_SNAPSHOT_VERSION}.")
+
+        lexical = Index.load(os.path.join(path, 'lexical'), mmap=mmap)
+        index = cls(
+            index_name=meta['index_name'],
+            text_fields=lexical.text_fields,
+            keyword_fields=lexical.keyword_fields,
+            vector_field=meta['vector_field'],
+            vectorizer_params=lexical.vectorizer_params,
+            engine=lexical.engine,
+            fusion=meta['fusion'],
+            rrf_k=meta['rrf_k'],
+            dense_weight=meta['dense_weight'],
+            num_candidates=meta['num_candidates']
+        )
+        index.lexical = lexical
+        index.embeddings = np.load(os.path.join(path, 'embeddings.npy'), mmap_mode='r' if mmap else None)
+
+        return index
 
-        return top_docs
\ No newline at end of file
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
@@ -1,7 +1,10 @@
+import os
 import pandas as pd
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
+from ann import IVFIndex
+import minsearch
 
 # Import Hugging Face tokenizer and OpenAI tokenizer (if applicable)
 from transformers import T5Tokenizer, T5Model
@@ -17,11 +20,14 @@ class Index:
         keyword_fields (list): List of keyword field names to index.
         vectorizers (dict): Dictionary of TfidfVectorizer or tokenizers instances for each text field.
         keyword_df (pd.DataFrame): DataFrame containing keyword field data.
+        keyword_index (dict): Value to rows index of every keyword field, used by the keyword filters.
         text_matrices (dict): Dictionary of TF-IDF matrices or embedding matrices for each text field.
         docs (list): List of documents indexed.
         use_tfidf (bool): Whether to use TF-IDF or another tokenizer.
+        batch_size (int): Number of texts encoded per forward pass of the Hugging Face model.
+        ann_indexes (dict): Dictionary of IVFIndex instances for each text field, when approximate search is enabled.
     """
-    def __init__(self, index_name, text_fields, keyword_fields, vectorizer_params={}, tokenizer_name='tfidf'):
+    def __init__(self, index_name, text_fields, keyword_fields, vectorizer_params={}, tokenizer_name='tfidf', batch_size=32, num_threads=None, ann=None, ann_params={}):
         """
         Initializes the Index with specified text and keyword fields and tokenizer type.
 
@@ -30,11 +36,22 @@ class Index:
             keyword_fields (list): List of keyword field names to index.
             vectorizer_params (dict): Optional parameters to pass to TfidfVectorizer or tokenizers.
             tokenizer_name (str): Type of tokenizer to use: 'tfidf', 't5', or 'openai'.
+            batch_size (int): Number of texts encoded per forward pass of the Hugging Face model.
+            num_threads (int): Number of CPU threads torch uses for inference. Defaults to torch's own setting.
+            ann (str): Set to 'ivf' to search dense embeddings with an approximate IVF index instead of a full scan.
+                Ignored for 'tfidf'.
+            ann_params (dict): Optional parameters to pass to IVFIndex, e.g. n_lists and n_probe.
         """
         self.index_name = index_name
         self.text_fields = text_fields
         self.keyword_fields = keyword_fields
         self.tokenizer_name = tokenizer_name
+        self.batch_size = batch_size
+        self.ann = ann if tokenizer_name != 'tfidf' else None
+        self.ann_params = ann_params
+
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
 
         if tokenizer_name == 'tfidf':
             self.vectorizers = {field: TfidfVectorizer(**vectorizer_params) for field in text_fields}
@@ -48,13 +65,45 @@ class Index:
             self.vectorizers = {field: self._openai_embed for field in text_fields}
 
         self.keyword_df = None
+        self.keyword_index = {}
         self.text_matrices = {}
+        self.ann_indexes = {}
         self.docs = []
 
     def _huggingface_embed(self, text):
-        inputs = self.tokenizer(text, return_tensors="pt", padding=True, truncation=True)
-        outputs = self.model(**inputs)
-        return outputs.last_hidden_state.mean(dim=1).detach().numpy()
+        return self._huggingface_embed_batch([text])
+
+    def _huggingface_embed_batch(self, texts):
+        """
+        Embeds texts with the T5 encoder in length-sorted batches.
+
+        Texts are tokenized once, sorted by token count so every batch is padded to a similar length, and
+        mean-pooled over their attention mask so padding doesn't dilute the embeddings.
+
+        Returns:
+            np.ndarray: float32 matrix with one row per text, in the order of `texts`.
+        """
+        encoded = self.tokenizer(list(texts), truncation=True)
+        order = np.argsort([len(input_ids) for input_ids in encoded['input_ids']], kind='stable')
+        embeddings = np.zeros((len(texts), self.model.config.d_model), dtype=np.float32)
+        encoder = self.model.get_encoder()
+
+        with torch.inference_mode():
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                inputs = self.tokenizer.pad(
+                    {
+                        'input_ids': [encoded['input_ids'][i] for i in batch],
+                        'attention_mask': [encoded['attention_mask'][i] for i in batch]
+                    },
+                    return_tensors="pt"
+                )
+                hidden = encoder(**inputs).last_hidden_state
+                mask = inputs['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+                embeddings[batch] = pooled.numpy()
+
+        return embeddings
 
     def _openai_embed(self, text):
         # Replace with the actual OpenAI embedding function.
@@ -77,15 +126,21 @@ class Index:
 
             if self.tokenizer_name == 'tfidf':
                 self.text_matrices[field] = self.vectorizers[field].fit_transform(texts)
+            elif self.tokenizer_name == 't5':
+                self.text_matrices[field] = self._huggingface_embed_batch(texts)
             else:
                 embeddings = np.vstack([self.vectorizers[field](text) for text in texts])
                 self.text_matrices[field] = embeddings
 
+            if self.ann == 'ivf':
+                self.ann_indexes[field] = IVFIndex(**self.ann_params).fit(self.text_matrices[field])
+
         for doc in docs:
             for field in self.keyword_fields:
                 keyword_data[field].append(doc.get(field, ''))
 
         self.keyword_df = pd.DataFrame(keyword_data)
+        self.keyword_index = {field: minsearch.Index._build_keyword_index(keyword_data[field]) for field in self.keyword_fields}
 
         return self
 
@@ -107,6 +162,9 @@ class Index:
         else:
             query_vecs = {field: self.vectorizers[field](query) for field in self.text_fields}
 
+        if self.ann_indexes:
+            return self._ann_search(query_vecs, filter_dict, boost_dict, num_results)
+
         scores = np.zeros(len(self.docs))
 
         # Compute cosine similarity for each text field and apply boost
@@ -116,10 +174,9 @@ class Index:
             scores += sim * boost
 
         # Apply keyword filters
-        for field, value in filter_dict.items():
-            if field in self.keyword_fields:
-                mask = self.keyword_df[field] == value
-                scores = scores * mask.to_numpy()
+        mask = self._filter_mask(filter_dict)
+        if mask is not None:
+            scores = scores * mask
 
         # Use argpartition to get top num_results indices
         top_indices = np.argpartition(scores, -num_results)[-num_results:]
@@ -129,3 +186,66 @@ class Index:
         top_docs = [self.docs[i] for i in top_indices if scores[i] > 0]
 
         return top_docs
+
+    def _ann_search(self, query_vecs, filter_dict, boost_dict, num_results):
+        """
+        Collects the approximate nearest neighbours of every text field and re-ranks them with exact boosted scores.
+        """
+        mask = self._filter_mask(filter_dict)
+
+        candidates = np.unique(np.concatenate([
+            self.ann_indexes[field].search(query_vec, k=num_results, mask=mask)[0][0]
+            for field, query_vec in query_vecs.items()
+        ]))
+        if len(candidates) == 0:
+            return []
+
+        scores = np.zeros(len(candidates))
+        for field, query_vec in query_vecs.items():
+            sim = cosine_similarity(query_vec, self.text_matrices[field][candidates]).flatten()
+            scores += sim * boost_dict.get(field, 1)
+
+        top_indices = np.argsort(-scores, kind='stable')[:num_results]
+
+        return [self.docs[candidates[i]] for i in top_indices if scores[i] > 0]
+
+    def _filter_mask(self, filter_dict):
+        """
+        Boolean mask of the documents matching every keyword filter, or None if no filter applies.
+        """
+        rows = None
+        for field, value in filter_dict.items():
+            if field in self.keyword_fields:
+                field_rows = self._keyword_rows(field).get(value, np.zeros(0, dtype=np.int64))
+                rows = field_rows if rows is None else np.intersect1d(rows, field_rows, assume_unique=True)
+
+        if rows is None:
+            return None
+
+        mask = np.zeros(len(self.docs), dtype=bool)
+        mask[rows] = True
+        return mask
+
+    def _keyword_rows(self, field):
+        """
+        Value to rows index of a keyword field, built on first use for indexes pickled before it existed.
+        """
+        keyword_index = self.__dict__.setdefault('keyword_index', {})
+        if field not in keyword_index:
+            keyword_index[field] = minsearch.Index._build_keyword_index(self.keyword_df[field].tolist())
+        return keyword_index[field]
+
+    def save_ann(self, path):
+        """
+        Writes the IVF index of every text field to a subdirectory of `path`.
+        """
+        for field, ann_index in self.ann_indexes.items():
+            ann_index.save(os.path.join(path, field))
+        return path
+
+    def load_ann(self, path, mmap=True):
+        """
+        Loads the IVF indexes written by `save_ann` for the text fields of this index.
+        """
+        self.ann_indexes = {field: IVFIndex.load(os.path.join(path, field), mmap=mmap) for field in self.text_fields}
+        return self
@@ -1,60 +1,121 @@
+import contextlib
 import time
+from embeddings import embed_with_openai
+
+def encode_query(query, **kwargs):
+    if kwargs['sentence_encoder'] == "1. T5":
+        return kwargs['encoder'].encode(query).tolist()
+    elif kwargs['sentence_encoder'] == "2. OpenAI":
+        return embed_with_openai(kwargs['embedding_client'], kwargs['embedding_model'], [query], dimensions=768)[0]
+
+def es_filters(scope):
+    filters = []
+    for field, value in scope.items():
+        if isinstance(value, dict):
+            filters.append({"range": {field: value}})
+        elif isinstance(value, (list, tuple, set)):
+            filters.append({"terms": {field: list(value)}})
+        else:
+            filters.append({"term": {field: value}})
+    return filters
+
+def chroma_where(scope):
+    conditions = []
+    for field, value in scope.items():
+        if isinstance(value, dict):
+            conditions += [{field: {f"${op}": bound}} for op, bound in value.items()]
+        elif isinstance(value, (list, tuple, set)):
+            conditions.append({field: {"$in": list(value)}})
+        else:
+            conditions.append({field: value})
+
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
 
 def search(query, **kwargs):
+    """
+    Searches the library for sentences relevant to the query.
+
+    `scope` restricts the search to part of the library, e.g. {'episode_guid': guid} for one episode,
+    {'podcast_id': id} for one show or {} for everything. Values can also be lists of values
+    or range bounds ('gt', 'gte', 'lt', 'lte'), e.g. {'publish_date': {'gte': 20240101}}, or
+    {'start': {'gte': 600, 'lt': 900}} for the sentences from minute 10 to 15 of an episode.
+    """
     vector_db = kwargs['vector_db']
+    scope = kwargs.get('scope') or {}
 
     if vector_db == "1. Minsearch":
         boost = {'text':3.0}
         results = kwargs['index'].search(
             query=query,
+            filter_dict=scope,
             boost_dict=boost, 
             num_results=kwargs['num_results']
         )
     elif vector_db=="2. Elasticsearch":
         # Encode the query
-        if kwargs['sentence_encoder'] == "1. T5":
-            query_vector = kwargs['encoder'].encode(query).tolist()
-        elif kwargs['sentence_encoder'] == "2. OpenAI":
-            query_vector = kwargs['embedding_client'].embeddings.create(model=kwargs['embedding_model'], input=query).data[0].embedding[:768]
+        query_vector = encode_query(query, **kwargs)
 
-        # Construct the search query
+        # Construct the search query, an approximate knn search over the HNSW graph
         search_query = {
             "size": kwargs['num_results'],  # Limit the number of results
-            "query": {
-                "script_score": {
-                    "query": {
-                        "match_all": {}
-                    },
-                    "script": {
-                        "source": "cosineSimilarity(params.query_vector, 'text_vector') + 1.0",
-                        "params": {
-                            "query_vector": query_vector
-                        }
-                    }
+            "knn": {
+                "field": "text_vector",
+                "query_vector": query_vector,
+                "k": kwargs['num_results'],
+                # candidates gathered per shard, higher values trade latency for recall
+                "num_candidates": max(kwargs.get('num_candidates', 100), kwargs['num_results'])
+            },
+            "_source": ["id", "text", "podcast_id", "episode_guid", "publish_date", "start", "end"]
+        }
+        if scope:
+            # filtered inside the knn search, so k results still come back
+            search_query["knn"]["filter"] = es_filters(scope)
+        if kwargs.get('es_hybrid', False):
+            dense_weight = kwargs.get('dense_weight')
+            if dense_weight is None:
+                dense_weight = 0.5
+            # scores of the match and knn clauses are added up
+            search_query["query"] = {
+                "bool": {
+                    "must": {"match": {"text": {"query": query, "boost": 1.0 - dense_weight}}},
+                    "filter": es_filters(scope)
                 }
             }
-        }
+            search_query["knn"]["boost"] = dense_weight
         # Execute the search query
         results = kwargs['vector_db_client'].search(index=kwargs['index_name'], body=search_query)
         results = results['hits']['hits']
         
     elif vector_db=="3. ChromaDB":
         # Encode the query
-        if kwargs['sentence_encoder'] == "1. T5":
-            query_vector = kwargs['encoder'].encode(query).tolist()
-        elif kwargs['sentence_encoder'] == "2. OpenAI":
-            query_vector = kwargs['embedding_client'].embeddings.create(model=kwargs['embedding_model'], input=query).data[0].embedding[:768]
+        query_vector = encode_query(query, **kwargs)
         
-        # Perform cosine similarity search in ChromaDB
-        results = kwargs['vector_db_client'].get_or_create_collection(kwargs['index_name']).query(
+        # Perform cosine similarity search in ChromaDB, on the collection handle kept in the session
+        collection = kwargs['index'] if kwargs.get('index') is not None else kwargs['vector_db_client'].get_or_create_collection(kwargs['index_name'])
+        results = collection.query(
             query_embeddings=[query_vector],
             n_results=kwargs['num_results'],
+            where=chroma_where(scope),
             include=["metadatas", "documents", "distances"]
         )
         
         # return results["metadatas"]
         results = results["metadatas"][0]
 
+    elif vector_db=="4. Hybrid":
+        # Lexical and dense scores from the same in-memory index, fused by rank
+        boost = {'text':3.0}
+        results = kwargs['index'].search(
+            query=query,
+            query_vector=encode_query(query, **kwargs),
+            filter_dict=scope,
+            boost_dict=boost,
+            num_results=kwargs['num_results'],
+            dense_weight=kwargs.get('dense_weight')
+        )
+
 
     return results
 
@@ -106,18 +167,24 @@ def llm(prompt, **kwargs):
 # rag 
 def rag(query, **kwargs):
 
-    search_results = search(
-        query, 
-        vector_db=kwargs['vector_db'], 
-        sentence_encoder=kwargs['sentence_encoder'], 
-        encoder=kwargs['encoder'] if 'encoder' in kwargs.keys() else None, 
-        index_name=kwargs['index_name'], 
-        index=kwargs['index'], 
-        vector_db_client=kwargs['vector_db_client'] if 'vector_db_client' in kwargs.keys() else None, 
-        embedding_model=kwargs['embedding_model'] if 'embedding_model' in kwargs.keys() else None, 
-        embedding_client=kwargs['embedding_client'] if 'embedding_client' in kwargs.keys() else None,
-        num_results=5
-        )
+    # the episode may still be indexing on another thread
+    with kwargs.get('index_lock') or contextlib.nullcontext():
+        search_results = search(
+            query, 
+            vector_db=kwargs['vector_db'], 
+            sentence_encoder=kwargs['sentence_encoder'], 
+            encoder=kwargs['encoder'] if 'encoder' in kwargs.keys() else None, 
+            index_name=kwargs['index_name'], 
+            index=kwargs['index'], 
+            vector_db_client=kwargs['vector_db_client'] if 'vector_db_client' in kwargs.keys() else None, 
+            embedding_model=kwargs['embedding_model'] if 'embedding_model' in kwargs.keys() else None, 
+            embedding_client=kwargs['embedding_client'] if 'embedding_client' in kwargs.keys() else None,
+            num_candidates=kwargs.get('num_candidates', 100),
+            es_hybrid=kwargs.get('es_hybrid', False),
+            dense_weight=kwargs.get('dense_weight'),
+            scope=kwargs.get('scope', {}),
+            num_results=5
+            )
 
     prompt = build_prompt(query, search_results)
 
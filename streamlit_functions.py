@@ -4,15 +4,47 @@ from openai import OpenAI
 import replicate
 from elasticsearch import Elasticsearch
 from elasticsearch.exceptions import AuthenticationException, ConnectionError
-from ingest import create_index
+from ingest import create_index, get_episode_metadata, merge_parts
 from transformers import T5ForConditionalGeneration, T5Tokenizer
 from sentence_transformers import SentenceTransformer
 import chromadb
+from embeddings import EmbeddingCache
+from jobs import JobQueue
+from artifacts import ArtifactStore
 
 def update_session(**kwargs):
     for k, v in kwargs.items():
         st.session_state[k] = v
 
+# One worker pool per server process, shared by every session
+@st.cache_resource
+def get_job_queue():
+    return JobQueue("./jobs.db", max_workers=2)
+
+@st.cache_resource
+def get_artifact_store():
+    return ArtifactStore("./artifacts")
+
+# Polls the ingest job without blocking the script thread, the whole app re-runs once the first part is searchable
+@st.fragment(run_every=1)
+def show_job_state(job_id):
+    job = get_job_queue().get(job_id)
+    if job['state'] == 'failed' or 'part' in job['progress']:
+        st.rerun()
+    st.info(f"{job['state'].capitalize()}...")
+
+def refresh_episode_details(job_id):
+    # only the parts indexed since the last run are read, the transcript in the session grows with them
+    job_queue = get_job_queue()
+    if 'episode_details' not in st.session_state:
+        update_session(episode_details=job_queue.output(job_id)['episode_details'], parts_loaded=0)
+    parts = job_queue.parts(job_id, start=st.session_state['parts_loaded'])
+    if parts:
+        update_session(
+            episode_details=merge_parts(st.session_state['episode_details'], parts),
+            parts_loaded=st.session_state['parts_loaded'] + len(parts)
+        )
+
 # Function to apply settings and reset states
 def apply_settings():
     update_session(settings_applied=True)
@@ -66,9 +98,12 @@ def choose_encoder():
         index=None
     )
     update_session(sentence_encoder_selected=False)
+    if 'embedding_cache' not in st.session_state:
+        update_session(embedding_cache=EmbeddingCache("./embedding_cache.db"))
     if sentence_encoder == "1. T5":
-        encoder=SentenceTransformer("sentence-transformers/sentence-t5-base")
-        update_session(sentence_encoder_selected=True, sentence_encoder=sentence_encoder, encoder=encoder)
+        encoder_name = "sentence-transformers/sentence-t5-base"
+        encoder=SentenceTransformer(encoder_name)
+        update_session(sentence_encoder_selected=True, sentence_encoder=sentence_encoder, encoder=encoder, encoder_name=encoder_name)
     elif sentence_encoder == "2. OpenAI":
         embedding_model = "text-embedding-3-large"
         openai_api_key = st.text_input("OpenAI API Key", key="file_oa_api_key", type="password")
@@ -110,7 +145,7 @@ def choose_transcription_method():
             update_session(transcription_method_selected=True)
 
 def choose_vector_db():
-    help_message = "Recommended choice: ChromaDB.\n\nUse Minsearch if you want a quick preview of the app.\n\nElasticsearch is less performant.\n\n⚠️ Please note that an API key will be required in order to use the Elasticsearch vectorb database. For more details see: https://elasticsearch-py.readthedocs.io/en/v8.10.1/quickstart.html"
+    help_message = "Recommended choice: ChromaDB.\n\nUse Minsearch if you want a quick preview of the app.\n\nHybrid combines Minsearch's keyword matching with the sentence encoder's embeddings.\n\nElasticsearch is less performant.\n\n⚠️ Please note that an API key will be required in order to use the Elasticsearch vectorb database. For more details see: https://elasticsearch-py.readthedocs.io/en/v8.10.1/quickstart.html"
     st.subheader('Select a vector database', help=help_message)
     st.session_state['index_name'] = "podcast-transcriber"
     vector_db = st.radio(
@@ -118,7 +153,8 @@ def choose_vector_db():
         options = (
             "1. Minsearch",
             "2. Elasticsearch",
-            "3. ChromaDB"
+            "3. ChromaDB",
+            "4. Hybrid"
         ),
         index=None,
     )
@@ -151,6 +187,29 @@ def choose_vector_db():
         update_session(index=create_index(**st.session_state))
         update_session(vector_db_selected=True, index_created=True)
         st.success(f"Index {st.session_state['vector_db_client'].list_collections()[0].name} was created successfully.")
+    elif vector_db=="4. Hybrid":
+        update_session(vector_db=vector_db)
+        update_session(index=create_index(**st.session_state))
+        update_session(vector_db_selected=True, index_created=True)
+        st.success(f"Index {st.session_state['index'].index_name} was created successfully.")
+
+def choose_search_scope():
+    scope_option = st.radio(
+        "Search in:",
+        options = (
+            "1. This episode",
+            "2. This show",
+            "3. Whole library"
+        ),
+        horizontal=True,
+    )
+    metadata = get_episode_metadata(st.session_state['episode_details'])
+    if scope_option == "1. This episode":
+        update_session(scope={'episode_guid': metadata['episode_guid']})
+    elif scope_option == "2. This show":
+        update_session(scope={'podcast_id': metadata['podcast_id']})
+    elif scope_option == "3. Whole library":
+        update_session(scope={})
 
 def choose_llm():
     help_message = "Recommended choice: FLAN-5.\n\nUse GPT-4o if want to interact with a more conversant LLM.\n\n⚠️ Please note that an API key will be required in order to use GPT-4o, which may incur an additional cost. For more details see: https://openai.com/index/openai-api/"
@@ -0,0 +1,70 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# the modules under test live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeServer(BaseHTTPRequestHandler):
+    """
+    Base of the local fakes of the HTTP APIs the pipeline talks to. Requests of every method go to `route`, which
+    subclasses implement; the state they share lives on `self.server`, guarded by `self.server.lock`.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.route()
+
+    do_POST = do_PUT = do_DELETE = do_GET
+
+    def route(self):
+        raise NotImplementedError
+
+    @property
+    def path_only(self):
+        return self.path.split('?')[0]
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def respond(self, status, payload, headers={}):
+        content = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+@pytest.fixture
+def serve():
+    """
+    Starts a FakeServer subclass on a free local port, with the given attributes set on the server, and stops it
+    after the test. The server's base URL is in its `url` attribute.
+    """
+    servers = []
+
+    def serve(handler, **state):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.lock = threading.Lock()
+        server.url = f"http://127.0.0.1:{server.server_port}"
+        for name, value in state.items():
+            setattr(server, name, value)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,64 @@
+import numpy as np
+
+from ingest import create_documents, make_chunk_id, populate_chroma_collection
+
+
+class FakeCollection:
+    """
+    Keeps what a Chroma collection would in memory, recording the ids every upsert and delete wrote.
+    """
+
+    def __init__(self):
+        self.metadatas = {}
+        self.upserted = []
+        self.deleted = []
+
+    def get(self, ids=None, where=None, include=None):
+        found = [_id for _id in (ids if ids is not None else self.metadatas) if _id in self.metadatas]
+        if where:
+            found = [_id for _id in found if all(self.metadatas[_id].get(field) == value for field, value in where.items())]
+        return {'ids': found}
+
+    def upsert(self, ids, embeddings, metadatas):
+        self.metadatas.update(zip(ids, metadatas))
+        self.upserted.extend(ids)
+
+    def delete(self, ids):
+        for _id in ids:
+            self.metadatas.pop(_id, None)
+        self.deleted.extend(ids)
+
+
+def make_documents(n, edited={}):
+    chunks = [
+        {'id': str(i + 1), 'text': edited.get(i, f"sentence {i + 1}"), 'timestamp': [i * 5.0, i * 5.0 + 4.0]}
+        for i in range(n)
+    ]
+    documents = create_documents(chunks, {'podcast_id': '1', 'episode_guid': 'episode-1', 'publish_date': 20240101})
+    return documents, np.ones((n, 4), dtype=np.float32)
+
+
+def test_reingesting_an_unchanged_episode_writes_nothing():
+    collection = FakeCollection()
+    documents, embeddings = make_documents(10)
+    assert populate_chroma_collection(documents, embeddings, collection, batch_size=4) == 10
+    collection.upserted.clear()
+
+    assert populate_chroma_collection(documents, embeddings, collection, batch_size=4) == 0
+
+    assert collection.upserted == [] and collection.deleted == []
+    assert sorted(collection.metadatas) == sorted(make_chunk_id('episode-1', doc) for doc in documents)
+
+
+def test_an_edited_sentence_replaces_only_its_own_entry():
+    collection = FakeCollection()
+    documents, embeddings = make_documents(5)
+    populate_chroma_collection(documents, embeddings, collection)
+    collection.upserted.clear()
+
+    edited_documents, _ = make_documents(5, edited={2: 'sentence three'})
+    assert populate_chroma_collection(edited_documents, embeddings, collection) == 1
+
+    assert collection.upserted == [make_chunk_id('episode-1', edited_documents[2])]
+    assert collection.deleted == [make_chunk_id('episode-1', documents[2])]
+    assert sorted(collection.metadatas) == sorted(make_chunk_id('episode-1', doc) for doc in edited_documents)
@@ -0,0 +1,119 @@
+import json
+import os
+import re
+
+import pytest
+
+import utils
+from conftest import FakeServer
+from utils import download_audio_file
+
+SEGMENT_SIZE = 100_000
+DROP_AFTER = 30_000
+
+
+class RangeServer(FakeServer):
+    """
+    Serves `data` with byte ranges and If-Range. The next `drops` responses are cut off after DROP_AFTER bytes,
+    as if the connection dropped.
+    """
+
+    def route(self):
+        server = self.server
+        requested = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        with server.lock:
+            server.ranges.append(requested)
+            data, etag = server.data, server.etag
+
+        if requested and (if_range is None or if_range == etag):
+            first, last = re.match(r'bytes=(\d+)-(\d*)', requested).groups()
+            first, last = int(first), int(last) if last else len(data) - 1
+            body = data[first:last + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {first}-{last}/{len(data)}")
+        else:
+            body = data
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        with server.lock:
+            drop = server.drops > 0 and len(body) > DROP_AFTER
+            server.drops -= drop
+        if drop:
+            self.wfile.write(body[:DROP_AFTER])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(serve, monkeypatch):
+    # no backoff between retries
+    monkeypatch.setattr(utils.time, 'sleep', lambda seconds: None)
+    return serve(RangeServer, data=os.urandom(4 * SEGMENT_SIZE), etag='"v1"', drops=0, ranges=[])
+
+
+def download(server, path, **kwargs):
+    return download_audio_file(f"{server.url}/episode.mp3", str(path), min_segment_size=SEGMENT_SIZE, chunk_size=8192, **kwargs)
+
+
+def interrupt(server, path):
+    server.drops = 4
+    assert download(server, path, max_retries=0) is None
+
+    with open(f"{path}.part.json", 'r') as f:
+        return json.load(f)
+
+
+def test_segments_are_downloaded_in_parallel(server, tmp_path):
+    path = tmp_path / 'episode.mp3'
+
+    assert download(server, path) == str(path)
+
+    assert path.read_bytes() == server.data
+    assert sorted(server.ranges[1:]) == sorted(f"bytes={i * SEGMENT_SIZE}-{(i + 1) * SEGMENT_SIZE - 1}" for i in range(4))
+    assert not os.path.exists(f"{path}.part") and not os.path.exists(f"{path}.part.json")
+
+
+def test_dropped_connections_are_retried(server, tmp_path):
+    path = tmp_path / 'episode.mp3'
+    server.drops = 4
+
+    assert download(server, path, max_retries=1) == str(path)
+
+    assert path.read_bytes() == server.data
+    # every range asked again for the rest of its segment only
+    retried = server.ranges[5:]
+    assert len(retried) == 4 and all(int(requested[6:].split('-')[0]) % SEGMENT_SIZE > 0 for requested in retried)
+
+
+def test_interrupted_download_resumes_where_it_stopped(server, tmp_path):
+    path = tmp_path / 'episode.mp3'
+    state = interrupt(server, path)
+
+    assert all(0 < written < end - start for start, end, written in state['segments'])
+    server.ranges.clear()
+
+    assert download(server, path) == str(path)
+
+    assert path.read_bytes() == server.data
+    # only what was missing is fetched again
+    assert sorted(server.ranges[1:]) == sorted(f"bytes={start + written}-{end - 1}" for start, end, written in state['segments'])
+    assert not os.path.exists(f"{path}.part") and not os.path.exists(f"{path}.part.json")
+
+
+def test_changed_file_is_downloaded_from_scratch(server, tmp_path):
+    path = tmp_path / 'episode.mp3'
+    interrupt(server, path)
+
+    server.data, server.etag = os.urandom(4 * SEGMENT_SIZE), '"v2"'
+    server.ranges.clear()
+
+    assert download(server, path) == str(path)
+
+    assert path.read_bytes() == server.data
+    assert sorted(server.ranges[1:]) == sorted(f"bytes={i * SEGMENT_SIZE}-{(i + 1) * SEGMENT_SIZE - 1}" for i in range(4))
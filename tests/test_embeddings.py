@@ -0,0 +1,84 @@
+import json
+
+import openai
+import pytest
+
+import embeddings
+from conftest import FakeServer
+from embeddings import embed_with_openai
+
+
+class FakeEmbeddingsAPI(FakeServer):
+    """
+    Speaks the embeddings endpoint: the embedding of "text <n>" is [n, n + 0.5, n + 0.25], and the items of every
+    response come back in reverse order, so only their index tells which text they belong to.
+    """
+
+    def route(self):
+        body = json.loads(self.read_body())
+        texts = body['input']
+        with self.server.lock:
+            self.server.requests.append(texts)
+            status = self.server.failures.pop(texts[0], 200)
+
+        if status != 200:
+            self.respond(status, {'error': {'message': 'try again', 'type': 'server_error', 'code': None}})
+            return
+
+        data = [
+            {'object': 'embedding', 'index': i, 'embedding': [n, n + 0.5, n + 0.25]}
+            for i, n in ((i, float(text.split()[1])) for i, text in enumerate(texts))
+        ]
+        self.respond(200, {'object': 'list', 'data': data[::-1], 'model': body['model'], 'usage': {'prompt_tokens': 1, 'total_tokens': 1}})
+
+
+@pytest.fixture
+def server(serve, monkeypatch):
+    # no backoff between retries
+    monkeypatch.setattr(embeddings.time, 'sleep', lambda seconds: None)
+    return serve(FakeEmbeddingsAPI, requests=[], failures={})
+
+
+@pytest.fixture
+def client(server):
+    # retries are left to embed_with_openai
+    return openai.OpenAI(api_key='test', base_url=f"{server.url}/v1", max_retries=0)
+
+
+def test_batches_come_back_in_order(server, client):
+    texts = [f"text {n}" for n in range(25)]
+
+    vectors = embed_with_openai(client, 'fake-model', texts, dimensions=2, max_workers=4, max_batch_size=4)
+
+    assert vectors == [[float(n), n + 0.5] for n in range(25)]
+    assert sorted(len(batch) for batch in server.requests) == [1] + [4] * 6
+    assert sorted(text for batch in server.requests for text in batch) == sorted(texts)
+
+
+def test_batches_respect_the_token_limit(server, client):
+    texts = [f"text {n}" for n in range(10)]
+
+    embed_with_openai(client, 'fake-model', texts, max_batch_tokens=2 * embeddings.estimate_tokens(texts[0]))
+
+    assert [len(batch) for batch in server.requests] == [2] * 5
+
+
+def test_rate_limited_and_failed_batches_are_retried(server, client):
+    texts = [f"text {n}" for n in range(12)]
+    server.failures.update({'text 0': 429, 'text 4': 503})
+
+    vectors = embed_with_openai(client, 'fake-model', texts, dimensions=1, max_batch_size=4)
+
+    assert vectors == [[float(n)] for n in range(12)]
+    assert [batch[0] for batch in server.requests].count('text 0') == 2
+    assert [batch[0] for batch in server.requests].count('text 4') == 2
+    assert [batch[0] for batch in server.requests].count('text 8') == 1
+
+
+def test_client_errors_are_not_retried(server, client):
+    server.failures['text 0'] = 400
+
+    with pytest.raises(openai.BadRequestError):
+        embed_with_openai(client, 'fake-model', ['text 0', 'text 1'])
+
+    assert len(server.requests) == 1
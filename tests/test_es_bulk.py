@@ -0,0 +1,165 @@
+import json
+
+import numpy as np
+import pytest
+from elasticsearch import Elasticsearch
+
+from conftest import FakeServer
+from ingest import create_documents, make_chunk_id, populate_es_index
+
+
+class FakeElasticsearch(FakeServer):
+    """
+    Speaks the parts of the Elasticsearch API populate_es_index uses, keeping the documents in `stored`. Documents
+    whose text is in `rejected` fail with a mapping error, and a _bulk request holding a text in `broken` fails as a
+    whole.
+    """
+
+    def route(self):
+        body = self.read_body().decode('utf-8')
+        path = self.path_only
+        with self.server.lock:
+            self.server.calls.append((self.command, path))
+
+        if path.endswith('/_settings'):
+            with self.server.lock:
+                self.server.refresh_intervals.append(json.loads(body)['index']['refresh_interval'])
+            self.respond(200, {'acknowledged': True})
+        elif path.endswith('/_refresh'):
+            self.respond(200, {'_shards': {'total': 1, 'successful': 1, 'failed': 0}})
+        elif path.endswith('/_delete_by_query'):
+            query = json.loads(body)['query']
+            with self.server.lock:
+                self.server.deleted_by.append(query)
+                deleted = [_id for _id, source in self.server.stored.items() if self.matches(query, _id, source)]
+                for _id in deleted:
+                    del self.server.stored[_id]
+            self.respond(200, {'deleted': len(deleted), 'failures': []})
+        elif path == '/_bulk':
+            self.bulk([json.loads(line) for line in body.splitlines() if line])
+        else:
+            self.respond(404, {'error': f"no handler for {path}", 'status': 404})
+
+    def bulk(self, lines):
+        actions = list(zip(lines[::2], lines[1::2]))
+        if any(source['text'] in self.server.broken for _, source in actions):
+            self.respond(500, {'error': {'type': 'internal_server_error', 'reason': 'node left the cluster'}, 'status': 500})
+            return
+
+        items = []
+        for action, source in actions:
+            (op_type, meta), = action.items()
+            _id = meta['_id']
+            with self.server.lock:
+                exists = _id in self.server.stored
+                if source['text'] in self.server.rejected:
+                    error = {'type': 'mapper_parsing_exception', 'reason': 'failed to parse field [start]'}
+                    item = {'status': 400, 'error': error}
+                elif op_type == 'create' and exists:
+                    error = {'type': 'version_conflict_engine_exception', 'reason': f"[{_id}]: document already exists"}
+                    item = {'status': 409, 'error': error}
+                else:
+                    self.server.stored[_id] = source
+                    self.server.indexed.append(_id)
+                    item = {'status': 200 if exists else 201, 'result': 'updated' if exists else 'created'}
+            items.append({op_type: {'_index': meta['_index'], '_id': _id, **item}})
+        self.respond(200, {'took': 1, 'errors': any('error' in result for item in items for result in item.values()), 'items': items})
+
+    @staticmethod
+    def matches(query, _id, source):
+        # the term and bool filter/must_not ids queries populate_es_index sends
+        if 'term' in query:
+            (field, value), = query['term'].items()
+            return source.get(field) == value
+        return (
+            all(FakeElasticsearch.matches(clause, _id, source) for clause in query['bool'].get('filter', []))
+            and not any(_id in clause['ids']['values'] for clause in query['bool'].get('must_not', []))
+        )
+
+    def respond(self, status, payload):
+        # the client refuses servers that don't say they are Elasticsearch
+        super().respond(status, payload, headers={'X-Elastic-Product': 'Elasticsearch'})
+
+
+@pytest.fixture
+def server(serve):
+    return serve(FakeElasticsearch, calls=[], refresh_intervals=[], deleted_by=[], stored={}, indexed=[], rejected=set(), broken=set())
+
+
+@pytest.fixture
+def client(server):
+    return Elasticsearch(server.url, retry_on_status=())
+
+
+def make_documents(n, edited={}):
+    chunks = [
+        {'id': str(i + 1), 'text': edited.get(i, f"sentence {i + 1}"), 'timestamp': [i * 5.0, i * 5.0 + 4.0]}
+        for i in range(n)
+    ]
+    documents = create_documents(chunks, {'podcast_id': '1', 'episode_guid': 'episode-1', 'publish_date': 20240101})
+    return documents, np.ones((n, 4), dtype=np.float32)
+
+
+def test_rejected_documents_are_collected(server, client):
+    documents, embeddings = make_documents(20)
+    server.rejected.update({'sentence 3', 'sentence 17'})
+
+    result = populate_es_index(documents, embeddings, 'podcasts', client, chunk_size=5, thread_count=2, replace_episode=False)
+
+    assert result['indexed'] == 18
+    assert sorted(failure['id'] for failure in result['failed']) == sorted(
+        make_chunk_id('episode-1', documents[i]) for i in (2, 16)
+    )
+    assert all(failure['status'] == 400 for failure in result['failed'])
+    assert all(failure['error']['type'] == 'mapper_parsing_exception' for failure in result['failed'])
+    assert len(server.indexed) == 18
+
+
+def test_failed_requests_fail_their_whole_chunk(server, client):
+    documents, embeddings = make_documents(20)
+    server.broken.add('sentence 7')
+
+    result = populate_es_index(documents, embeddings, 'podcasts', client, chunk_size=5, thread_count=2, replace_episode=False)
+
+    assert result['indexed'] == 15
+    assert sorted(failure['id'] for failure in result['failed']) == sorted(
+        make_chunk_id('episode-1', documents[i]) for i in range(5, 10)
+    )
+    assert all(failure['status'] == 500 for failure in result['failed'])
+
+
+def test_refreshes_are_restored_after_the_load(server, client):
+    documents, embeddings = make_documents(6)
+    server.broken.update(doc['text'] for doc in documents)
+
+    populate_es_index(documents, embeddings, 'podcasts', client, chunk_size=5, replace_episode=False)
+
+    assert server.refresh_intervals == ['-1', None]
+    assert server.calls[-1] == ('POST', '/podcasts/_refresh')
+
+
+def test_reingesting_an_unchanged_episode_writes_nothing(server, client):
+    documents, embeddings = make_documents(10)
+    populate_es_index(documents, embeddings, 'podcasts', client, chunk_size=4)
+    stored = dict(server.stored)
+    server.indexed.clear()
+
+    result = populate_es_index(documents, embeddings, 'podcasts', client, chunk_size=4)
+
+    assert (result['indexed'], result['skipped'], result['failed']) == (0, 10, [])
+    assert server.indexed == []
+    assert server.stored == stored
+
+
+def test_only_the_stale_sentences_of_a_reingested_episode_are_deleted(server, client):
+    documents, embeddings = make_documents(5)
+    populate_es_index(documents, embeddings, 'podcasts', client)
+    server.indexed.clear()
+
+    edited_documents, _ = make_documents(5, edited={2: 'sentence three'})
+    result = populate_es_index(edited_documents, embeddings, 'podcasts', client)
+
+    assert server.calls[0] == ('POST', '/podcasts/_delete_by_query')
+    assert (result['indexed'], result['skipped']) == (1, 4)
+    assert server.indexed == [make_chunk_id('episode-1', edited_documents[2])]
+    assert sorted(server.stored) == sorted(make_chunk_id('episode-1', doc) for doc in edited_documents)
@@ -0,0 +1,53 @@
+import sqlite3
+import subprocess
+import sys
+import threading
+
+from jobs import JobQueue
+
+
+def add_job(path, job_id, state, owner):
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            'INSERT INTO jobs (id, description, state, progress, created, updated, owner) VALUES (?, ?, ?, ?, 0, 0, ?)',
+            (job_id, '', state, '{}', owner)
+        )
+
+
+def test_only_the_jobs_of_stopped_processes_are_failed_on_start(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    queue = JobQueue(path, max_workers=1)
+    started, release = threading.Event(), threading.Event()
+    running = queue.submit(lambda job: (started.set(), release.wait()))
+    started.wait()
+
+    stopped = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+    add_job(path, 'stopped', 'transcribing', f"{queue.owner.rsplit(':', 1)[0]}:{stopped.stdout.strip()}")
+    add_job(path, 'unowned', 'queued', None)
+    add_job(path, 'remote', 'indexing', 'another-host:1')
+
+    other = JobQueue(path, max_workers=1)
+
+    assert other.get('stopped')['state'] == 'failed'
+    assert other.get('unowned')['state'] == 'failed'
+    assert other.get('remote')['state'] == 'indexing'
+    assert other.get(running)['state'] == 'queued'
+
+    release.set()
+    queue.shutdown()
+    other.shutdown()
+    assert queue.get(running)['state'] == 'done'
+
+
+def test_parts_are_read_from_the_given_part_on(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'), max_workers=1)
+
+    def function(job):
+        for part in range(3):
+            job.add_part(part, chunks=[f"chunk {part}"])
+
+    job_id = queue.submit(function)
+    queue.shutdown()
+
+    assert queue.parts(job_id) == [{'chunks': ['chunk 0']}, {'chunks': ['chunk 1']}, {'chunks': ['chunk 2']}]
+    assert queue.parts(job_id, start=2) == [{'chunks': ['chunk 2']}]
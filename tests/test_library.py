@@ -0,0 +1,30 @@
+import numpy as np
+
+from ingest import create_documents, create_index, populate_hybrid_index
+
+
+def make_episode(guid, n):
+    chunks = [{'id': str(i + 1), 'text': f"{guid} sentence {i + 1}", 'timestamp': [i * 5.0, i * 5.0 + 4.0]} for i in range(n)]
+    documents = create_documents(chunks, {'podcast_id': '1', 'episode_guid': guid, 'publish_date': 20240101})
+    embeddings = np.random.default_rng(n).normal(size=(n, 4)).astype(np.float32)
+    return documents, embeddings
+
+
+def test_hybrid_episodes_are_kept_in_the_library(tmp_path):
+    settings = {'vector_db': "4. Hybrid", 'index_name': 'podcasts', 'library_path': str(tmp_path)}
+    first, second = create_index(**settings), create_index(**settings)
+
+    populate_hybrid_index(*make_episode('episode-1', 3), first, library_path=str(tmp_path / 'podcasts-hybrid'))
+    documents, embeddings = make_episode('episode-2', 2)
+    populate_hybrid_index(documents, embeddings, second, library_path=str(tmp_path / 'podcasts-hybrid'))
+
+    library = create_index(**settings)
+    assert sorted((doc['episode_guid'], doc['id']) for doc in library.docs) == [
+        ('episode-1', '1'), ('episode-1', '2'), ('episode-1', '3'), ('episode-2', '1'), ('episode-2', '2')
+    ]
+    rows = [row for row, doc in enumerate(library.docs) if doc['episode_guid'] == 'episode-2']
+    assert np.allclose(library.embeddings[rows], embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True))
+    results = library.search('sentence', embeddings[0], filter_dict={'episode_guid': 'episode-2'}, num_results=5)
+    assert [doc['text'] for doc in results] == ['episode-2 sentence 1', 'episode-2 sentence 2']
+    # the Minsearch library is kept apart
+    assert not (tmp_path / 'podcasts').exists()
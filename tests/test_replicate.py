@@ -0,0 +1,150 @@
+import json
+import re
+import threading
+
+import pytest
+import replicate
+from replicate.exceptions import ModelError
+
+from conftest import FakeServer
+from transcribe import ReplicateTranscriber
+
+
+class FakeReplicate(FakeServer):
+    """
+    Speaks the file and prediction endpoints of the Replicate API. A prediction of split "<name>.mp3" succeeds on
+    its first poll with the output {'text': name}, unless the split is in `busy` (the first create is answered
+    with 503), `failing` (the prediction fails) or `slow` (it keeps running until canceled).
+    """
+
+    def route(self):
+        body = self.read_body()
+        path = self.path_only
+        server = self.server
+
+        if path == '/v1/files':
+            name = re.search(rb'filename="([^"]+)\.mp3"', body).group(1).decode('utf-8')
+            self.respond(201, {
+                'id': name, 'name': f"{name}.mp3", 'content_type': 'audio/mpeg', 'size': 1, 'etag': '', 'checksums': {},
+                'metadata': {}, 'created_at': '', 'expires_at': None, 'urls': {'get': f"https://files.test/{name}"}
+            })
+            return
+
+        if path == '/v1/predictions':
+            name = json.loads(body)['input']['audio'].rsplit('/', 1)[1]
+            with server.lock:
+                server.attempts[name] = server.attempts.get(name, 0) + 1
+                if name in server.busy and server.attempts[name] == 1:
+                    self.respond(503, {'title': 'Service unavailable', 'detail': 'busy', 'status': 503})
+                    return
+                prediction_id = f"p{len(server.predictions)}"
+                server.predictions[prediction_id] = {'name': name, 'status': 'starting'}
+                server.running += 1
+                server.peak = max(server.peak, server.running)
+            self.respond(201, self.prediction(prediction_id))
+            return
+
+        prediction_id = path.split('/')[3]
+        with server.lock:
+            prediction = server.predictions[prediction_id]
+            if prediction['status'] in ('succeeded', 'failed', 'canceled'):
+                pass
+            elif path.endswith('/cancel'):
+                prediction['status'] = 'canceled'
+                server.canceled.append(prediction['name'])
+                server.running -= 1
+            elif prediction['name'] not in server.slow:
+                prediction['status'] = 'failed' if prediction['name'] in server.failing else 'succeeded'
+                server.running -= 1
+        self.respond(200, self.prediction(prediction_id))
+
+    def prediction(self, prediction_id):
+        prediction = self.server.predictions[prediction_id]
+        succeeded = prediction['status'] == 'succeeded'
+        return {
+            'id': prediction_id, 'model': 'whisper', 'version': 'v', 'status': prediction['status'], 'input': {},
+            'output': {'text': prediction['name'], 'chunks': []} if succeeded else None,
+            'error': 'CUDA out of memory' if prediction['status'] == 'failed' else None,
+            'logs': '', 'urls': {}
+        }
+
+
+@pytest.fixture
+def server(serve):
+    return serve(
+        FakeReplicate, attempts={}, predictions={}, canceled=[], busy=set(), failing=set(), slow=set(), running=0, peak=0
+    )
+
+
+@pytest.fixture
+def client(server):
+    return replicate.Client(api_token='test', base_url=server.url)
+
+
+@pytest.fixture
+def splits(tmp_path):
+    paths = []
+    for i in range(6):
+        path = tmp_path / f"split{i}.mp3"
+        path.write_bytes(bytes([i]) * 1024)
+        paths.append(str(path))
+    return paths
+
+
+def make_transcriber(client, **kwargs):
+    return ReplicateTranscriber(client, **{'max_concurrency': 3, 'backoff': 0.01, 'poll_interval': 0.01, **kwargs})
+
+
+def test_splits_come_back_in_order_within_the_concurrency_limit(server, client, splits):
+    outputs = list(make_transcriber(client).iter_transcribe(splits))
+
+    assert [(i, output['text']) for i, output in outputs] == [(i, f"split{i}") for i in range(6)]
+    assert server.peak <= 3
+
+
+def test_unavailable_server_is_retried(server, client, splits):
+    server.busy.add('split1')
+
+    outputs = list(make_transcriber(client).iter_transcribe(splits))
+
+    assert outputs[1] == (1, {'text': 'split1', 'chunks': []})
+    assert server.attempts['split1'] == 2
+
+
+def test_failed_predictions_are_retried_up_to_max_retries(server, client, splits):
+    server.failing.add('split0')
+
+    transcriber = make_transcriber(client, max_concurrency=1, max_retries=2)
+    with pytest.raises(ModelError):
+        list(transcriber.iter_transcribe(splits))
+
+    assert server.attempts == {'split0': 3}
+
+
+def test_running_predictions_are_canceled_once_a_split_fails(server, client, splits):
+    server.failing.add('split0')
+    server.slow.update(f"split{i}" for i in range(1, 6))
+
+    # the failure shows up on the first poll, once the splits next to it have started
+    transcriber = make_transcriber(client, max_retries=0, poll_interval=0.2)
+    with pytest.raises(ModelError):
+        list(transcriber.iter_transcribe(splits))
+
+    # the splits running next to the failed one were canceled, the ones queued behind them never started
+    assert sorted(server.canceled) == ['split1', 'split2']
+    assert server.running == 0
+    assert set(server.attempts) == {'split0', 'split1', 'split2'}
+
+
+def test_cancel_stops_a_transcription_in_progress(server, client, splits):
+    server.slow.update(f"split{i}" for i in range(6))
+    transcriber = make_transcriber(client)
+
+    timer = threading.Timer(0.2, transcriber.cancel)
+    timer.start()
+    with pytest.raises(RuntimeError, match='canceled'):
+        list(transcriber.iter_transcribe(splits))
+    timer.join()
+
+    assert sorted(server.canceled) == ['split0', 'split1', 'split2']
+    assert server.running == 0
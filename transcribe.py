@@ -1,117 +1,323 @@
+import os
+import random
+import re
+import threading
 import time
+import collections
 import concurrent.futures
-from utils import shrink_and_split_mp3
-import io
+from utils import shrink_and_split_mp3, choose_n_splits, get_duration_ms, iter_audio_windows
+import httpx
+import numpy as np
 import torch
+from replicate.exceptions import ModelError, ReplicateError
 from faster_whisper import WhisperModel
 from tqdm import tqdm
-from pydub import AudioSegment
-from utils import chunk_text_into_sentences
 
-def infer_from_replicate(replicate_client, mp3_file):
-    # Read the local audio file in binary mode
-    with open(mp3_file, "rb") as f:
-        audio_blob = io.BytesIO(f.read())  # Use BytesIO to create a file-like object
-
-    # create sepaarte function
-    output = replicate_client.run(
-        "vaibhavs10/incredibly-fast-whisper:3ab86df6c8f54c11309d4d1f930ac292bad43ace52d10c80d87eb258b3c9f79c",
-        input={
-            "task": "transcribe",
-            "audio": audio_blob,
-            "language": "None",
-            "timestamp": "chunk",
-            "batch_size": 64,
-            "diarise_audio": False
-        }
-    )
-
-    return output
-
-def transcribe_with_replicate(replicate_client, mp3_file, n_splits=2):
-    start_time = time.time()
-    # shrink and split mp3 - return list of partial episodes
-    mp3_files = shrink_and_split_mp3(mp3_file[0], n_splits)
-    # Using ThreadPoolExecutor to parallelize downloads
-    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:        
-        # Submit the transcription tasks to the executor
-        futures = {
-            executor.submit(infer_from_replicate, replicate_client, mp3_file): i for i, mp3_file in enumerate(mp3_files)
-        }
-        # Collect the results in the original order based on submission index
-        results = [None] * len(mp3_files)
-        for future in concurrent.futures.as_completed(futures):
-            i = futures[future]  # Index of the mp3 file part
-            results[i] = future.result()  # Store result in the correct index
+# Longest part decoded into memory at once by the local transcription: 10 minutes of float32 samples is about 38 MB
+MAX_WINDOW_MS = 10 * 60 * 1000
+
+# vaibhavs10/incredibly-fast-whisper
+REPLICATE_WHISPER_VERSION = "3ab86df6c8f54c11309d4d1f930ac292bad43ace52d10c80d87eb258b3c9f79c"
+REPLICATE_MAX_CONCURRENCY = 4
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+def iter_in_order(function, items, max_workers, on_error=None):
+    """
+    Runs `function` over `items` in a thread pool and yields (i, result) in the order of `items`,
+    each one as soon as it and all the ones before it are done.
+
+    `items` is consumed lazily, with at most `max_workers` items submitted and not yet yielded, so a generator
+    of large items (e.g. decoded audio) is never held in memory all at once.
+
+    As soon as any item fails, even one whose turn hasn't come, or when the caller stops iterating, the items
+    not started yet are dropped and `on_error`, if given, is called before waiting for the running ones, so it
+    can make them stop early.
+    """
+    def pop_result():
+        while not pending[0].done():
+            failed = [future for future in pending if future.done() and future.exception() is not None]
+            if failed:
+                return failed[0].result()
+            concurrent.futures.wait([future for future in pending if not future.done()], return_when=concurrent.futures.FIRST_COMPLETED)
+        return pending.popleft().result()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = collections.deque()
+        i = 0
+        try:
+            for item in items:
+                if len(pending) == max_workers:
+                    yield i, pop_result()
+                    i += 1
+                pending.append(executor.submit(function, item))
+            while pending:
+                yield i, pop_result()
+                i += 1
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            if on_error is not None:
+                on_error()
+            raise
+
+def normalize_sentence(text):
+    return ' '.join(re.sub(r'[^\w\s]', '', text.lower()).split())
+
+def stitch_chunks(previous, following, window=3):
+    """
+    De-duplicates the sentences transcribed twice where two consecutive splits overlap.
+
+    The leading chunks of `following` that repeat the end of `previous` are dropped. When the first chunk kept
+    completes the last chunk of `previous`, that chunk was cut off mid-sentence and is flagged for removal.
+
+    Args:
+        previous (list of dict): Chunks of the earlier split.
+        following (list of dict): Chunks of the later split.
+        window (int): Number of chunks on each side of the boundary compared.
+
+    Returns:
+        tuple: The number of trailing chunks to drop from `previous`, and `following` without the repeated chunks.
+    """
+    tail = [normalize_sentence(chunk['text']) for chunk in previous[-window:]]
+    tail_text = ' '.join(tail)
+    if not tail_text:
+        return 0, following
+
+    # The longest run of leading chunks that together make up the end of the earlier split
+    repeated, head_text = 0, ''
+    for j, chunk in enumerate(following[:window]):
+        head_text = ' '.join(filter(None, [head_text, normalize_sentence(chunk['text'])]))
+        if head_text and tail_text.endswith(head_text) and (len(head_text) == len(tail_text) or tail_text[-len(head_text) - 1] == ' '):
+            repeated = j + 1
+    following = following[repeated:]
+
+    drop = 0
+    if following and tail[-1]:
+        first = normalize_sentence(following[0]['text'])
+        if first != tail[-1] and first.startswith(tail[-1]):
+            drop = 1
+
+    return drop, following
+
+def offset_chunks(chunks, offset):
+    """
+    Shifts the timestamps of the chunks of a split by where the split starts in the episode, in seconds.
+    """
+    if not offset:
+        return chunks
+    return [
+        {**chunk, 'timestamp': [None if time is None else round(time + offset, 2) for time in chunk['timestamp']]} if chunk.get('timestamp') else chunk
+        for chunk in chunks
+    ]
+
+def merge_outputs(outputs):
     chunks = []
-    text = ''
-    for output in results:
-        chunks += output['chunks']
-        text = " ".join([text, output['text']])
+    for output in outputs:
+        drop, output_chunks = stitch_chunks(chunks, output['chunks'])
+        chunks = chunks[:len(chunks) - drop] + output_chunks
+    # rebuilt from the stitched chunks, so the overlaps aren't repeated
+    text = " ".join(chunk['text'].strip() for chunk in chunks)
     for i, chunk in enumerate(chunks):
         chunk['id'] = str(i+1)
+    return chunks, text
+
+def is_retryable(error):
+    # a failed prediction is retried too, since it is mostly a worker running out of memory or time
+    if isinstance(error, (ModelError, httpx.TransportError)):
+        return True
+    return isinstance(error, ReplicateError) and error.status in RETRY_STATUS_CODES
+
+class ReplicateTranscriber:
+    """
+    Transcribes splits with Replicate's incredibly-fast-whisper, with at most `max_concurrency` predictions
+    running at a time.
+
+    A split whose upload or prediction fails with a rate limit, a server error, a dropped connection or a failed
+    prediction is retried with exponential backoff. Once a split fails for good, the predictions still running
+    are canceled on Replicate, so they stop costing money.
+
+    Every request goes through `client`, so pointing it at a fake server, e.g.
+    replicate.Client(api_token="test", base_url="http://localhost:5000") or a client built with an httpx
+    `transport`, lets the whole flow run without Replicate.
+
+    Attributes:
+        client (replicate.Client): The Replicate client.
+        max_concurrency (int): Maximum number of predictions running at a time.
+        max_retries (int): Retries per split.
+        backoff (float): Seconds waited before the first retry, doubled on every one after.
+        poll_interval (float): Seconds between two checks of a running prediction.
+    """
+
+    def __init__(self, client, max_concurrency=REPLICATE_MAX_CONCURRENCY, max_retries=3, backoff=2.0, poll_interval=1.0, version=REPLICATE_WHISPER_VERSION):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.version = version
+        self._canceled = threading.Event()
+
+    def transcribe(self, mp3_file):
+        """
+        Transcribes one split, retrying transient failures. Returns the prediction output.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._predict(mp3_file)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e) or self._canceled.is_set():
+                    raise
+            # wakes up early if the transcription is canceled meanwhile
+            if self._canceled.wait(self.backoff * 2 ** attempt * (1 + random.random())):
+                break
+        raise RuntimeError(f"Transcription of {mp3_file} was canceled.")
+
+    def iter_transcribe(self, mp3_files):
+        """
+        Transcribes the splits in parallel and yields (i, output) for every split, in order.
+        """
+        yield from iter_in_order(self.transcribe, mp3_files, self.max_concurrency, on_error=self.cancel)
+
+    def cancel(self):
+        """
+        Cancels the predictions running and stops the splits waiting to be retried.
+        """
+        self._canceled.set()
+
+    def _predict(self, mp3_file):
+        if self._canceled.is_set():
+            raise RuntimeError(f"Transcription of {mp3_file} was canceled.")
+
+        # the open file is streamed to Replicate's file API instead of being read into memory first
+        with open(mp3_file, "rb") as f:
+            prediction = self.client.predictions.create(
+                version=self.version,
+                input={
+                    "task": "transcribe",
+                    "audio": f,
+                    "language": "None",
+                    "timestamp": "chunk",
+                    "batch_size": 64,
+                    "diarise_audio": False
+                }
+            )
+
+        while prediction.status not in ("succeeded", "failed", "canceled"):
+            if self._canceled.wait(self.poll_interval):
+                prediction.cancel()
+                raise RuntimeError(f"Transcription of {mp3_file} was canceled.")
+            prediction.reload()
+
+        if prediction.status == "canceled":
+            raise RuntimeError(f"Transcription of {mp3_file} was canceled on Replicate.")
+        if prediction.status == "failed":
+            raise ModelError(prediction)
+        return prediction.output
+
+def infer_from_replicate(replicate_client, mp3_file):
+    return ReplicateTranscriber(replicate_client).transcribe(mp3_file)
+
+def iter_transcribe_with_replicate(replicate_client, mp3_file, n_splits=None, max_concurrency=REPLICATE_MAX_CONCURRENCY):
+    """
+    Transcribes the splits in parallel and yields (i, n_splits, output) for every split, in order.
+    """
+    # shrink and split mp3 - return list of partial episodes
+    mp3_files, offsets = shrink_and_split_mp3(mp3_file[0], n_splits, max_workers=max_concurrency)
+    transcriber = ReplicateTranscriber(replicate_client, max_concurrency=max_concurrency)
+    for i, output in transcriber.iter_transcribe(mp3_files):
+        yield i, len(mp3_files), {**output, 'chunks': offset_chunks(output['chunks'], offsets[i])}
+
+def transcribe_with_replicate(replicate_client, mp3_file, n_splits=None, max_concurrency=REPLICATE_MAX_CONCURRENCY):
+    start_time = time.time()
+    chunks, text = merge_outputs(output for _, _, output in iter_transcribe_with_replicate(replicate_client, mp3_file, n_splits, max_concurrency))
     end_time = time.time()
     execution_time = end_time - start_time
     print(f"Time to run the command: {execution_time} seconds")
     return chunks, text
 
-def infer_from_whistler(file_path):
-  # define our torch configuration
-  device = "cuda" if torch.cuda.is_available() else "cpu"
-  # compute_type = "float16" if torch.cuda.is_available() else "float32"
-  compute_type = "int8"
+# Whisper models loaded in this process, shared by all the transcriptions
+whisper_models = {}
+whisper_models_lock = threading.Lock()
+
+def get_whisper_model(model_size="distil-large-v3", cpu_threads=None, num_workers=1):
+    """
+    Returns the process-wide WhisperModel for the given settings, loading it on first use.
+
+    Args:
+        model_size (str): The faster-whisper model name.
+        cpu_threads (int): CPU threads per worker. Defaults to the CPU count split between the workers.
+        num_workers (int): Number of transcriptions the model runs at the same time, from different threads.
+
+    Returns:
+        WhisperModel: The shared model.
+    """
+    # define our torch configuration
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    # compute_type = "float16" if torch.cuda.is_available() else "float32"
+    compute_type = "int8"
+    if cpu_threads is None:
+        cpu_threads = max(1, (os.cpu_count() or 1) // num_workers)
+
+    key = (model_size, device, compute_type, cpu_threads, num_workers)
+    with whisper_models_lock:
+        if key not in whisper_models:
+            # load model on GPU if available, else cpu
+            whisper_models[key] = WhisperModel(model_size, device=device, compute_type=compute_type, cpu_threads=cpu_threads, num_workers=num_workers)
+    return whisper_models[key]
 
-  # load model on GPU if available, else cpu
-  model = WhisperModel("distil-large-v3", device=device, compute_type=compute_type)
+def infer_from_whistler(audio, model=None, offset=0.0):
+  # `audio` is a file path or 16 kHz mono float32 samples, starting `offset` seconds into the episode
+  if isinstance(audio, np.ndarray) and len(audio) == 0:
+    return {"chunks": [], "text": ""}
+
+  if model is None:
+    model = get_whisper_model()
     
   # fast whisper large 3
   final_transcription = ""
-  segments, info = model.transcribe(file_path, beam_size=1)
+  segments, info = model.transcribe(audio, beam_size=1)
 
   # Initialize the progress bar
-  pbar = tqdm(total=len(AudioSegment.from_file(file_path)) / 1000.0, unit='s')
+  pbar = tqdm(total=info.duration, unit='s')
 
+  # One chunk per segment, timed like the chunks of the Replicate transcriber
+  chunks = []
   for segment in segments:
       final_transcription += segment.text
+      chunks.append({'text': segment.text, 'timestamp': [round(segment.start, 2), round(segment.end, 2)]})
       pbar.update(segment.end - segment.start)
 
   # Close the progress bar
   pbar.close()
-
-  # Chunk the transcription text into sentences
-  sentences = chunk_text_into_sentences(final_transcription)
-
-  chunks = []
-  for sentence in sentences:
-      tmp_dict = {}
-      tmp_dict['text'] = sentence
-      chunks.append(tmp_dict)
         
   print("Audio transcription complete")
-  data = {"chunks": chunks, "text": final_transcription}
+  data = {"chunks": offset_chunks(chunks, offset), "text": final_transcription}
   return data
 
-def transcribe_with_whistler(filenames, n_splits=2):
+def iter_transcribe_with_whistler(filenames, n_splits=None, cpu_threads=None, num_workers=2):
+    """
+    Transcribes the splits in parallel on one shared model and yields (i, n_splits, output) for every split, in order.
+
+    The episode is decoded straight into float32 parts handed to the model, with no split MP3s written and decoded
+    again. Only the parts being transcribed are in memory, and none is longer than MAX_WINDOW_MS.
+    """
+    duration_ms = get_duration_ms(filenames[0])
+    if n_splits is None:
+        n_splits = choose_n_splits(duration_ms, num_workers, max_split_ms=MAX_WINDOW_MS)
+    windows = iter_audio_windows(filenames[0], n_splits, duration_ms)
+    # one model with `num_workers` workers, instead of one model per split
+    model = get_whisper_model(cpu_threads=cpu_threads, num_workers=num_workers)
+
+    def transcribe_window(window):
+        offset, samples = window
+        return infer_from_whistler(samples, model=model, offset=offset)
+
+    for i, output in iter_in_order(transcribe_window, windows, max_workers=num_workers):
+        yield i, n_splits, output
+
+def transcribe_with_whistler(filenames, n_splits=None, cpu_threads=None):
     start_time = time.time()
-    mp3_files = shrink_and_split_mp3(filenames[0], n_splits)
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=n_splits) as executor:        
-        # Submit the transcription tasks to the executor
-        futures = {
-            executor.submit(infer_from_whistler, mp3_file): i for i, mp3_file in enumerate(mp3_files)
-        }
-        # Collect the results in the original order based on submission index
-        results = [None] * len(mp3_files)
-        for future in concurrent.futures.as_completed(futures):
-            i = futures[future]  # Index of the mp3 file part
-            results[i] = future.result()  # Store result in the correct index
-    chunks = []
-    text = ''
-    for output in results:
-        chunks += output['chunks']
-        text = " ".join([text, output['text']])
-    for i, chunk in enumerate(chunks):
-        chunk['id'] = str(i+1)
+    chunks, text = merge_outputs(output for _, _, output in iter_transcribe_with_whistler(filenames, n_splits, cpu_threads))
     end_time = time.time()
     execution_time = end_time - start_time
     print(f"Time to run the command: {execution_time} seconds")
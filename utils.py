@@ -1,17 +1,35 @@
 import spacy
 from sentence_transformers.util import pytorch_cos_sim
 import requests
+from requests.adapters import HTTPAdapter
 import os
+import hashlib
+import json
+import math
+import subprocess
+import threading
+import time
 import concurrent.futures
+import numpy as np
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
 from urllib.parse import urlparse
 import feedparser
 from pydub import AudioSegment
-import nltk
-nltk.download('punkt_tab')
-from nltk.tokenize import sent_tokenize
+from pydub.silence import detect_silence
+from pydub.utils import mediainfo
+from embeddings import embed_with_openai
 
 nlp = spacy.load('en_core_web_sm')
 
+# Shared by all downloads, so the connections to a host are kept open and reused
+http_session = requests.Session()
+http_session.mount('http://', HTTPAdapter(pool_connections=8, pool_maxsize=16))
+http_session.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=16))
+
+# (connect, read) timeouts of the download requests, in seconds
+DOWNLOAD_TIMEOUT = (10, 60)
+
 def remove_punctuation(text):
     doc = nlp(text)
     return ' '.join([token.text.replace('.','').lower() for token in doc if not token.is_punct])
@@ -45,7 +63,7 @@ def get_feed_details(feed_url, **kwargs):
     if kwargs['sentence_encoder'] == "1. T5":
         title_vectors = kwargs['encoder'].encode(titles, batch_size=32).tolist()
     elif kwargs['sentence_encoder'] == "2. OpenAI":
-        title_vectors = [kwargs['embedding_client'].embeddings.create(model=kwargs['embedding_model'], input=title).data[0].embedding[:768] for title in titles]
+        title_vectors = embed_with_openai(kwargs['embedding_client'], kwargs['embedding_model'], titles, dimensions=768)
     
     # Iterate through feed.entries and use precomputed vectors
     for i, episode in enumerate(feed.entries):
@@ -54,6 +72,7 @@ def get_feed_details(feed_url, **kwargs):
             'summary': episode['summary'],
             'published_date': episode['published'],
             'audio_urls': episode.enclosures[0]['href'],
+            'guid': episode.get('id', episode.enclosures[0]['href']),
             'title_vector': title_vectors[i]
         }
 
@@ -68,7 +87,7 @@ def search_for_episode(episode_title, feed_details, **kwargs):
     if kwargs['sentence_encoder'] == "1. T5":
         query_vector = kwargs['encoder'].encode(remove_punctuation(episode_title)).tolist()
     elif kwargs['sentence_encoder'] == "2. OpenAI":
-        query_vector = kwargs['embedding_client'].embeddings.create(model=kwargs['embedding_model'], input=remove_punctuation(episode_title)).data[0].embedding[:768] 
+        query_vector = embed_with_openai(kwargs['embedding_client'], kwargs['embedding_model'], [remove_punctuation(episode_title)], dimensions=768)[0]
 
     [d.update({'cos_sim': pytorch_cos_sim(d['title_vector'], query_vector)}) for d in feed_details]
 
@@ -100,6 +119,7 @@ def fetch_latest_episode(feed_url):
             'summary': latest_episode['summary'],
             'published_date': latest_episode['published'],
             'audio_urls': latest_episode.enclosures[0]['href'],
+            'guid': latest_episode.get('id', latest_episode.enclosures[0]['href']),
             'status': 'Success'
         }
 
@@ -107,46 +127,309 @@ def fetch_latest_episode(feed_url):
         feed_dict = {'status': 'Fail'}
     return feed_dict
 
-def download_audio_file(audio_url, file_name):
-    """Download the audio file from the given URL."""
-    response = requests.get(audio_url, stream=True)
-    if response.status_code == 200:
-        with open(file_name, 'wb') as file:
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:
+def get_feed_episodes(feed_url):
+    """
+    Lists every episode of a feed that has audio, newest first, without encoding the titles like get_feed_details.
+    """
+    feed = feedparser.parse(feed_url)
+    return [
+        {
+            'title': episode.get('title', ''),
+            'published_date': episode.get('published'),
+            'audio_urls': episode.enclosures[0]['href'],
+            'guid': episode.get('id', episode.enclosures[0]['href'])
+        }
+        for episode in feed.entries if episode.get('enclosures')
+    ]
+
+def save_download_state(state_path, state):
+    with open(f"{state_path}.tmp", 'w') as f:
+        json.dump(state, f)
+    os.replace(f"{state_path}.tmp", state_path)
+
+def download_range(session, url, part_path, segment, etag, on_progress, chunk_size=1 << 20, max_retries=3):
+    """
+    Downloads the rest of one segment of a file into its place in the `.part` file, resuming after dropped connections.
+
+    Args:
+    segment (list): [start, end, written]: the byte range of the segment, end excluded, and how much of it is on disk.
+    etag (str): Strong ETag of the file, if any. The server sends the whole file instead of the range if it has changed.
+    on_progress (callable): Called after every chunk written, to persist the progress.
+    """
+    for attempt in range(max_retries + 1):
+        start, end, written = segment
+        if start + written >= end:
+            return
+
+        headers = {'Range': f"bytes={start + written}-{end - 1}"}
+        if etag:
+            headers['If-Range'] = etag
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status_code != 206:
+                    raise ValueError(f"Range request answered with status {response.status_code}, the file may have changed on the server")
+                with open(part_path, 'r+b') as f:
+                    f.seek(start + written)
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        f.write(chunk[:end - start - segment[2]])
+                        # on disk before it's recorded as written
+                        f.flush()
+                        segment[2] = min(end - start, segment[2] + len(chunk))
+                        on_progress()
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            if attempt == max_retries:
+                raise
+            time.sleep(2 ** attempt)
+
+    if segment[0] + segment[2] < segment[1]:
+        raise ValueError(f"Download of bytes {segment[0]}-{segment[1] - 1} stopped short")
+
+def download_audio_file(audio_url, file_name, session=None, max_segments=4, min_segment_size=8 << 20, chunk_size=1 << 20, max_retries=3):
+    """
+    Download the audio file from the given URL.
+
+    Files served with HTTP ranges are fetched as up to `max_segments` ranges in parallel into `file_name`.part, with
+    the progress of every range kept in `file_name`.part.json. A download cut short resumes where it stopped, as long
+    as the file on the server still has the same size and ETag. The result is checked against the Content-Length
+    before it's renamed to `file_name`.
+
+    Args:
+    audio_url (str): URL of the audio file.
+    file_name (str): Path to save the file to.
+    session (requests.Session): Session the requests are sent with. Defaults to the shared `http_session`.
+    max_segments (int): Maximum number of ranges downloaded at the same time.
+    min_segment_size (int): Minimum size of a range in bytes, so small files are fetched in one request.
+    chunk_size (int): Size of the chunks written to disk in bytes.
+    max_retries (int): Retries per range after a dropped connection or a timeout.
+
+    Returns:
+    str: `file_name`, or None if the download failed.
+    """
+    session = session or http_session
+    part_path, state_path = f"{file_name}.part", f"{file_name}.part.json"
+
+    try:
+        # Only ask for the first byte: the answer tells the size and ETag of the file, and whether ranges are supported
+        response = session.get(audio_url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=DOWNLOAD_TIMEOUT)
+        if response.status_code not in (200, 206):
+            response.close()
+            print(f"Failed to download audio file. Status code: {response.status_code}")
+            return None
+
+        total = response.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+        if response.status_code == 206 and total.isdigit():
+            response.close()
+            size = int(total)
+            # If-Range only takes strong ETags
+            etag = response.headers.get('ETag')
+            etag = etag if etag and not etag.startswith('W/') else None
+
+            state = None
+            if os.path.exists(state_path) and os.path.exists(part_path):
+                with open(state_path, 'r') as f:
+                    state = json.load(f)
+                if state.get('size') != size or state.get('etag') != etag or os.path.getsize(part_path) != size:
+                    state = None
+
+            if state is None:
+                n_segments = max(1, min(max_segments, size // min_segment_size))
+                bounds = [size * i // n_segments for i in range(n_segments + 1)]
+                state = {'size': size, 'etag': etag, 'segments': [[bounds[i], bounds[i + 1], 0] for i in range(n_segments)]}
+                with open(part_path, 'wb') as f:
+                    f.truncate(size)
+                save_download_state(state_path, state)
+
+            lock = threading.Lock()
+            def on_progress():
+                with lock:
+                    save_download_state(state_path, state)
+
+            # the URL after redirects, so the ranges don't go through them again
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(state['segments'])) as executor:
+                futures = [
+                    executor.submit(download_range, session, response.url, part_path, segment, etag, on_progress, chunk_size, max_retries)
+                    for segment in state['segments']
+                ]
+                for future in futures:
+                    future.result()
+        else:
+            if response.status_code == 206:
+                # a range of unknown total size, so start over without one
+                response.close()
+                response = session.get(audio_url, stream=True, timeout=DOWNLOAD_TIMEOUT)
+                response.raise_for_status()
+
+            # No ranges: stream the whole body. The Content-Length of a compressed body isn't the size on disk
+            size = None
+            if 'Content-Length' in response.headers and not response.headers.get('Content-Encoding'):
+                size = int(response.headers['Content-Length'])
+            with response, open(part_path, 'wb') as file:
+                for chunk in response.iter_content(chunk_size=chunk_size):
                     file.write(chunk)
+
+        if size is not None and os.path.getsize(part_path) != size:
+            raise ValueError(f"Expected {size} bytes, got {os.path.getsize(part_path)}")
+
+        os.replace(part_path, file_name)
+        if os.path.exists(state_path):
+            os.remove(state_path)
         print(f"Audio file downloaded successfully: {file_name}")
         return file_name
-    else:
-        print(f"Failed to download audio file. Status code: {response.status_code}")
+
+    except (requests.RequestException, OSError, ValueError) as e:
+        print(f"Failed to download audio file {audio_url}: {e}")
         return None
 
-def download_all(urls, podcast_name):
+def get_episode_filename(episode):
+    # Named after the GUID (or the URL), so an episode always lands in the same file and episodes never collide
+    key = episode.get('guid') or episode['audio_urls']
+    return f"episode_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}.mp3"
+
+def in_date_range(episode, start_date=None, end_date=None):
+    if start_date is None and end_date is None:
+        return True
+    try:
+        published = parsedate_to_datetime(episode['published_date']).date()
+    except (KeyError, TypeError, ValueError):
+        # undated episodes can't be placed in the range
+        return False
+    return (start_date is None or published >= start_date) and (end_date is None or published <= end_date)
+
+def download_all(episodes, podcast_name, max_workers=8, max_per_host=4, max_segments=None, start_date=None, end_date=None, on_progress=None):
+    """
+    Downloads many episodes of a show at once, e.g. its whole back catalogue.
+
+    Every episode is saved as audio/<show>/episode_<hash of its GUID>.mp3, and one already there is skipped, so
+    running a backfill again only fetches the new or failed episodes. At most `max_per_host` connections are open
+    to the same host at a time, whatever `max_workers`.
+
+    Args:
+    episodes (str, dict or list): An audio URL, an episode with 'audio_urls' and optionally 'guid' and 'published_date'
+        (e.g. from get_feed_episodes), or a list of them.
+    podcast_name (str): Name of the show, used as the directory name.
+    max_workers (int): Maximum number of episodes downloaded at the same time.
+    max_per_host (int): Maximum number of connections open to one host.
+    max_segments (int): Ranges downloaded in parallel per episode, at most `max_per_host`. Defaults to 4 for a single
+        episode and 1 for a batch, which is spread over episodes instead.
+    start_date (datetime.date): Only download the episodes published on or after this date.
+    end_date (datetime.date): Only download the episodes published on or before this date.
+    on_progress (callable): Called as on_progress(done=..., total=..., failed=...) after every episode,
+        e.g. the report method of a jobs.Job.
+
+    Returns:
+    list: The path of every selected episode, in order, or None for the ones that failed.
+    """
     # Create directory
     podcast_dir = os.path.join(".",os.path.join('audio'), podcast_name.replace(" ", "_").replace(":","-").replace('.',''))
     os.makedirs(podcast_dir) if not os.path.exists(podcast_dir) else None     
-    
+
+    if isinstance(episodes, (str, dict)):
+        episodes = [episodes]
+    episodes = [{'audio_urls': episode} if isinstance(episode, str) else episode for episode in episodes]
+    episodes = [episode for episode in episodes if in_date_range(episode, start_date, end_date)]
+
+    if max_segments is None:
+        max_segments = 4 if len(episodes) == 1 else 1
+    # every download holds `max_segments` connections to its host, more than one host's share would exceed it
+    max_segments = max(1, min(max_segments, max_per_host))
+    host_slots = defaultdict(lambda: threading.Semaphore(max(1, max_per_host // max_segments)))
+    lock = threading.Lock()
+    counts = {'done': 0, 'failed': 0}
+
+    def download(episode):
+        url = episode['audio_urls']
+        path = os.path.join(podcast_dir, get_episode_filename(episode))
+        if not os.path.exists(path):
+            with lock:
+                slots = host_slots[urlparse(url).netloc]
+            with slots:
+                path = download_audio_file(url, path, max_segments=max_segments)
+
+        with lock:
+            counts['done'] += 1
+            counts['failed'] += path is None
+            progress = {'done': counts['done'], 'total': len(episodes), 'failed': counts['failed']}
+        if on_progress is not None:
+            on_progress(**progress)
+        return path
+
     # Using ThreadPoolExecutor to parallelize downloads
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        # Submit the download tasks to the executor
-        futures = {executor.submit(download_audio_file, url, os.path.join(podcast_dir, f'episode_{i}.mp3')): os.path.join(podcast_dir, f'episode_{i}.mp3') for i, url in enumerate([urls])}
-        # Ensure all tasks are completed
-        concurrent.futures.wait(futures)
-    return list(futures.values())
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(download, episodes))
+
+# Whisper's input format
+SAMPLE_RATE = 16000
+
+def get_duration_ms(file_path):
+    return float(mediainfo(file_path)['duration']) * 1000
+
+def choose_n_splits(duration_ms, max_workers=None, min_split_ms=5 * 60 * 1000, max_splits=8, max_split_ms=None):
+    """
+    Number of parts to split an episode into: one per available worker, but no part shorter than `min_split_ms`.
+    When `max_split_ms` is given, there are enough parts that none is longer than it, whatever `max_splits`.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    n_splits = max(1, min(max_workers, max_splits, int(duration_ms // min_split_ms)))
+    if max_split_ms:
+        n_splits = max(n_splits, math.ceil(duration_ms / max_split_ms))
+    return n_splits
+
+def find_cut_points(audio, n_splits, search_ms=30_000, min_silence_ms=500, silence_offset_db=16):
+    """
+    Finds where to cut the audio into `n_splits` parts of about equal length.
+
+    Every cut is moved to the middle of the silence closest to it within `search_ms`, so words aren't cut in half.
+    Only the audio around the cuts is scanned. Where there is no silence nearby, the cut stays where it was.
+
+    Returns:
+    list: The cut positions in milliseconds.
+    """
+    audio_length = len(audio)
+    # quieter than the episode's average loudness by `silence_offset_db`
+    silence_thresh = audio.dBFS - silence_offset_db
+
+    cuts = []
+    for i in range(1, n_splits):
+        target = i * audio_length // n_splits
+        start = max(0, target - search_ms)
+        silences = detect_silence(audio[start:target + search_ms], min_silence_len=min_silence_ms, silence_thresh=silence_thresh, seek_step=10)
+        if silences:
+            middles = [start + (silence_start + silence_end) // 2 for silence_start, silence_end in silences]
+            cuts.append(min(middles, key=lambda middle: abs(middle - target)))
+        else:
+            cuts.append(target)
+
+    return cuts
 
-def shrink_and_split_mp3(mp3_file, n_splits):
+def shrink_and_split_mp3(mp3_file, n_splits=None, overlap_ms=2000, max_workers=None):
     """
-    Shrinks and splits the MP3 file into `n_splits` parts and returns the split parts in a list.
+    Shrinks and splits the MP3 file into parts cut at silences and returns the split parts in a list, with where
+    every part starts in the episode. Parts already split from the current version of the file are reused.
+
+    Every part but the first starts `overlap_ms` before its cut, so a word cut at a boundary is transcribed
+    whole at least once. The sentences transcribed twice are dropped by transcribe.stitch_chunks.
 
     Args:
     mp3_file (str): Path to the input MP3 file.
-    n_splits (int): The number of parts to split the audio file into.
+    n_splits (int): The number of parts to split the audio file into. Picked from the duration and `max_workers` if None.
+    overlap_ms (int): How far every part reaches back into the one before it, in milliseconds.
+    max_workers (int): Number of parts transcribed at the same time. Defaults to the CPU count.
 
     Returns:
-    list: A list of file paths for the split audio parts.
+    tuple: A list of file paths for the split audio parts, and the start of every part in seconds.
     """
+    if n_splits is None:
+        n_splits = choose_n_splits(get_duration_ms(mp3_file), max_workers)
+
     directory, filename = os.path.split(mp3_file)
     basename, ext = os.path.splitext(filename)
+
+    split_paths = [os.path.join(directory, f"{basename}_part_{i+1}_of_{n_splits}{ext}") for i in range(n_splits)]
+    # the starts aren't recoverable from the parts exactly, so they are kept next to them
+    offsets_path = os.path.join(directory, f"{basename}_parts_of_{n_splits}.json")
+    if all(os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(mp3_file) for path in split_paths + [offsets_path]):
+        with open(offsets_path, 'r') as f:
+            return split_paths, json.load(f)
     
     # Load the audio file
     audio = AudioSegment.from_mp3(mp3_file)
@@ -156,34 +439,119 @@ def shrink_and_split_mp3(mp3_file, n_splits):
     audio = audio.set_sample_width(16 // 8)  # 16 bits = 2 bytes    
     audio = audio.set_channels(1)  # Convert to mono
     
-    # Get the total length of the audio file (in milliseconds)
-    audio_length = len(audio)
-    
-    # Calculate the duration for each split part
-    split_duration = audio_length // n_splits
-    
-    # List to store the paths of the split audio parts
-    split_paths = []
+    # Cut at the silences closest to equal-length parts
+    cuts = [0] + find_cut_points(audio, n_splits) + [len(audio)]
     
     # Loop to split and export each part
+    offsets = []
     for i in range(n_splits):
-        start_time = i * split_duration
-        # Handle the last split to include any remaining audio
-        end_time = (i + 1) * split_duration if i < n_splits - 1 else audio_length
-        split_audio = audio[start_time:end_time]
-        
-        # Generate the file name for each split part
-        split_path = os.path.join(directory, f"{basename}_part_{i+1}{ext}")
+        start_time = max(0, cuts[i] - overlap_ms) if i > 0 else 0
+        split_audio = audio[start_time:cuts[i + 1]]
+        offsets.append(start_time / 1000)
         
         # Export the split part
-        split_audio.export(split_path, format="mp3")
-        
-        # Add the split part path to the list
-        split_paths.append(split_path)
+        split_audio.export(split_paths[i], format="mp3")
+
+    with open(offsets_path, 'w') as f:
+        json.dump(offsets, f)
     
-    return split_paths
+    return split_paths, offsets
+
+def find_silence_cut(samples, target, search, sample_rate=SAMPLE_RATE, min_silence_ms=500, silence_offset_db=16, frame_ms=10):
+    """
+    Same as find_cut_points, for one cut in decoded float samples: returns the middle of the silence closest
+    to sample `target` within `search` samples, or `target` if there is none.
+
+    Silence is measured against the loudness of `samples` rather than of the whole episode, which isn't decoded yet.
+    """
+    frame = sample_rate * frame_ms // 1000
+    start = max(0, target - search)
+    region = samples[start:min(len(samples), target + search)]
+    n_frames = len(region) // frame
+    if n_frames == 0:
+        return target
+
+    # loudness of every frame, and the threshold below which a frame is silent, both as RMS amplitudes
+    rms = np.sqrt(np.mean(np.square(region[:n_frames * frame].reshape(n_frames, frame)), axis=1))
+    silence_thresh = np.sqrt(np.mean(np.square(samples))) * 10 ** (-silence_offset_db / 20)
+
+    # runs of silent frames at least `min_silence_ms` long
+    edges = np.diff(np.concatenate([[0], (rms < silence_thresh).astype(np.int8), [0]]))
+    run_starts, run_ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    long_enough = (run_ends - run_starts) * frame_ms >= min_silence_ms
+    if not long_enough.any():
+        return target
+
+    middles = start + (run_starts[long_enough] + run_ends[long_enough]) * frame // 2
+    return int(middles[np.argmin(np.abs(middles - target))])
+
+def read_samples(process, n_samples, file_path):
+    """
+    Reads up to `n_samples` float32 samples from the output of an ffmpeg process, or all of the rest if None.
+
+    Returns:
+    tuple: The samples, and whether the end of the audio was reached.
+    """
+    data = process.stdout.read() if n_samples is None else process.stdout.read(n_samples * 4)
+    exhausted = n_samples is None or len(data) < n_samples * 4
+    if exhausted and process.wait() != 0:
+        raise RuntimeError(f"Failed to decode {file_path}: {process.stderr.read().decode(errors='replace').strip()}")
+    return np.frombuffer(data[:len(data) - len(data) % 4], dtype=np.float32), exhausted
+
+def iter_audio_windows(file_path, n_splits, duration_ms, overlap_ms=2000, search_ms=30_000, sample_rate=SAMPLE_RATE):
+    """
+    Decodes an audio file straight to 16 kHz mono float32 samples and yields it as `n_splits` parts cut at silences,
+    without writing anything to disk.
+
+    ffmpeg decodes the file into a pipe that is read one part at a time, so only the part being cut (plus
+    `search_ms` past it) is held here, whatever the length of the episode. As in shrink_and_split_mp3, every part
+    but the first starts `overlap_ms` before its cut. Parts past the end of the audio, if `duration_ms` was
+    overestimated, are empty.
+
+    Args:
+    file_path (str): Path to the audio file.
+    n_splits (int): The number of parts.
+    duration_ms (float): The duration of the audio, used to place the cuts.
+    overlap_ms (int): How far every part reaches back into the one before it, in milliseconds.
+    search_ms (int): How far from its target a cut may move to land in a silence, in milliseconds.
+    sample_rate (int): Sample rate of the parts.
+
+    Yields:
+    tuple: The start of the part in seconds and its samples.
+    """
+    command = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', file_path, '-f', 'f32le', '-ac', '1', '-ar', str(sample_rate), '-']
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    overlap = overlap_ms * sample_rate // 1000
+    search = search_ms * sample_rate // 1000
+    # decoded samples not yet handed out in full, starting at sample `buffer_start` of the episode
+    buffer, buffer_start, exhausted = np.zeros(0, dtype=np.float32), 0, False
+
+    try:
+        for i in range(n_splits):
+            last = i == n_splits - 1
+            target = None if last else int((i + 1) * duration_ms * sample_rate / 1000 / n_splits)
+
+            if not exhausted:
+                missing = None if last else target + search - buffer_start - len(buffer)
+                if missing is None or missing > 0:
+                    samples, exhausted = read_samples(process, missing, file_path)
+                    buffer = np.concatenate([buffer, samples])
+
+            buffer_end = buffer_start + len(buffer)
+            if last or target >= buffer_end:
+                cut = buffer_end
+            else:
+                cut = buffer_start + find_silence_cut(buffer, target - buffer_start, search, sample_rate)
+
+            yield buffer_start / sample_rate, buffer[:cut - buffer_start]
 
-def chunk_text_into_sentences(text):
-    # Tokenize the text into sentences
-    sentences = sent_tokenize(text)
-    return sentences
+            # keep the overlap for the next part, unless the whole audio has been handed out
+            next_start = buffer_end if cut == buffer_end else max(buffer_start, cut - overlap)
+            buffer, buffer_start = buffer[next_start - buffer_start:], next_start
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        process.stderr.close()
+        process.wait()